@@ -14,27 +14,61 @@ Basic demo with a few runnable commands
 
 """
 import os
-import json
+import re
+import sys
+import copy
+import functools
 import time
+import hashlib
+import asyncio
 
-from openai import OpenAI
-from typing import Literal, Optional, List
-from pydantic import BaseModel, Field
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from typing import Literal, Optional, List, Protocol, Union
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, create_model
+from pydantic_core import from_json
 
 from pymavlink import mavutil
 from dronekit import connect, VehicleMode, LocationGlobal, LocationGlobalRelative
 
 # os.environ["OPENAI_API_KEY"] = <YOUR API KEY>
 
-if not os.environ.get("OPENAI_API_KEY"):
+# Optional: path to a local .gguf model to parse commands offline with llama-cpp-python instead of OpenAI
+# os.environ["LOCAL_MODEL_PATH"] = <PATH TO .gguf MODEL>
+
+if not os.environ.get("OPENAI_API_KEY") and not os.environ.get("LOCAL_MODEL_PATH"):
     os.environ["OPENAI_API_KEY"] = input("OpenAI API key: ")
 
+# Run with --force-llm to send every input to the LLM, ie to compare against the regex fast path
+FORCE_LLM = "--force-llm" in sys.argv
+
 # Connect to the vehicle - this is the default for Mission Planner SITL
 connection_string = 'tcp:127.0.0.1:5763'
 vehicle = connect(connection_string, wait_ready=True, baud=57600, rate=60)
 vehicle.mode = "GUIDED"
 print("Vehicle Connected.")
 
+# Prebuilt MAVLink messages for the commands, with the constant fields filled once at import
+# Body-frame local target, type_mask enables only the velocity fields; vx/vy/vz are set per command
+_LOCAL_TARGET_MSG = mavutil.mavlink.MAVLink_set_position_target_local_ned_message(
+    0, 0, 0, mavutil.mavlink.MAV_FRAME_BODY_OFFSET_NED,
+    0b0000111111000111, 0, 0, 0,
+    0, 0, 0,
+    0, 0, 0, 0, 0)
+
+# CONDITION_YAW command_long, called with the 7 params
+condition_yaw_msg = functools.partial(
+    mavutil.mavlink.MAVLink_command_long_message,
+    0, 0, mavutil.mavlink.MAV_CMD_CONDITION_YAW, 0)
+
+
+def send_local_target(vehicle, x, y, z):
+    """ Send a body-frame (FRD) local target, reusing the prebuilt message """
+    msg = copy.copy(_LOCAL_TARGET_MSG)
+    msg.vx, msg.vy, msg.vz = x, y, z
+    vehicle.send_mavlink(msg)
+
+
 # Commands: Pydantic objects with typed fields and a method to run the command with Dronekit
 class cmd_GoToCoords(BaseModel):
     """ 
@@ -47,18 +81,20 @@ class cmd_GoToCoords(BaseModel):
             {lat: float, lon: float, alt: Optional[float], frame: Literal["Relative", "Global"]}
         example: {"cmd_GoTo": {"lat": 38.9605, "lon": -77.3118, "alt": 20, "frame": "Relative"}}
     """
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
     lat: float = Field(..., description="Destination latitude, dec degrees")
     lon: float = Field(..., description="Destination longitude, dec degrees")
     alt: Optional[float] = Field(None, description="meters")
     frame: Literal["Relative", "Global"] = Field("Relative", description="Reference frame for the altitude")
 
     def run(self, vehicle):
-        if self.alt is None:
-            self.alt = vehicle.location.global_relative_frame.alt
+        # Commands are frozen, so hold current altitude in a local instead of setting self.alt
+        alt = vehicle.location.global_relative_frame.alt if self.alt is None else self.alt
         if self.frame == "Relative":
-            dest = LocationGlobalRelative(self.lat, self.lon, self.alt)
+            dest = LocationGlobalRelative(self.lat, self.lon, alt)
         elif self.frame == "Global":
-            dest = LocationGlobal(self.lat, self.lon, self.alt)
+            dest = LocationGlobal(self.lat, self.lon, alt)
         vehicle.simple_goto(dest)
         
 
@@ -71,6 +107,8 @@ class cmd_Takeoff(BaseModel):
         values: {"alt": float}
         example: {"cmd_Takeoff": {"alt": 10}}
     """
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
     alt: float = Field(10., description="meters")
 
     def run(self, vehicle):
@@ -85,6 +123,8 @@ class cmd_SetMode(BaseModel):
         values: {"GUIDED", "ALT_HOLD", "RTL", "AUTO"}
         example: {"cmd_SetMode": {"mode": "GUIDED"}}
     """
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
     mode: Literal["GUIDED", "ALT_HOLD", "RTL", "AUTO"]
     
     def run(self, vehicle):
@@ -99,6 +139,8 @@ class cmd_Arm(BaseModel):
         values: {"arm": bool}
         example: {"cmd_Arm": {"arm": True}}
     """
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
     arm: bool    
     
     def run(self, vehicle):
@@ -117,17 +159,14 @@ class cmd_GoToLocal(BaseModel):
         values: {"x": float, "y": float, "z": float}
         example: {"cmd_GoToLocal": {"x": 10, "y": 0, "z": 0}}
     """
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
     x: float = 0
     y: float = 0
     z: float = 0
 
     def run(self, vehicle):
-        msg = vehicle.message_factory.set_position_target_local_ned_encode(
-            0, 0, 0, mavutil.mavlink.MAV_FRAME_BODY_OFFSET_NED,
-            0b0000111111000111, 0, 0, 0,
-            self.x, self.y, -self.z, 
-            0, 0, 0, 0, 0)
-        vehicle.send_mavlink(msg)
+        send_local_target(vehicle, self.x, self.y, -self.z)
 
 
 class cmd_SetHeading(BaseModel):
@@ -142,6 +181,8 @@ class cmd_SetHeading(BaseModel):
         values: {"frame": Literal["Relative", "Global"], "yaw": float}
         example: {"cmd_SetHeading": {"frame": "Relative", "yaw": 25}}
     """
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
     frame: Literal["Relative", "Global"] = Field("Relative", description="Reference frame for the heading")
     yaw: float = Field(..., description="Yaw angle in degrees")
 
@@ -154,47 +195,103 @@ class cmd_SetHeading(BaseModel):
             is_relative = 1 
         else:
             is_relative = 0
-        # create the CONDITION_YAW command using command_long_encode()
-        msg = vehicle.message_factory.command_long_encode(
-            0, 0, mavutil.mavlink.MAV_CMD_CONDITION_YAW, 0, 
+        # create the CONDITION_YAW command from the prebuilt command_long
+        msg = condition_yaw_msg(
             self.yaw,
             yaw_speed, direction, is_relative, 
             0, 0, 0)
         vehicle.send_mavlink(msg)
 
+
+all_cmds = [
+    cmd_SetMode, 
+    cmd_Arm, 
+    cmd_GoToCoords, 
+    cmd_Takeoff, 
+    cmd_GoToLocal, 
+    cmd_SetHeading
+    ]
+
+# Each command is a single-key object named by its class, ie {"cmd_Arm": {"arm": true}}, as in the command docs
+WrappedCmd = Union[tuple(
+    create_model(f"Wrapped_{_cmd.__name__}", __config__=ConfigDict(extra='forbid'), **{_cmd.__name__: (_cmd, ...)})
+    for _cmd in all_cmds
+)]
+
+# Validator built once at import, for command objects received while streaming
+WRAPPED_CMD_ADAPTER = TypeAdapter(WrappedCmd)
+
 class CommandPromptOutput(BaseModel):
     """ Response from the LLM """
     speech_response: str = Field(
         ..., 
         description="A concise, simple operational response/acknowledgement from one pilot to another"
     )
-    commands: List[str] = Field(
+    commands: List[WrappedCmd] = Field(
         ..., 
         description="List of commands parsed from the input"
     )
 
 
-def parse_response_to_commands(response, available_cmds):
-    """ Parse the response to runnable commands """
-    cmds = response.output_parsed.commands
-    cmds = [json.loads(i) for i in cmds]
-    new_commands = []
-    for c in cmds:
-        cmd_name = list(c.keys())[0]
+class BatchedCommandPromptOutput(BaseModel):
+    """ Response from the LLM for a batch of user inputs """
+    items: List[CommandPromptOutput] = Field(
+        ...,
+        description="One response per user input, in the same order as the inputs"
+    )
+
+
+def parse_output_to_commands(output):
+    """ Parse a single CommandPromptOutput to runnable commands """
+    return unwrap_commands(output.commands)
+
 
-        # If the command name is in the list of all commands
-        if cmd_name in [cmd.__name__ for cmd in available_cmds]:
+def unwrap_commands(wrapped_cmds):
+    """ Runnable commands from their single-key WrappedCmd objects """
+    return [cmd for wrapped in wrapped_cmds for _, cmd in wrapped]
 
-            # ... Create an instance of the command class
-            cmd_class = [cmd for cmd in available_cmds if cmd.__name__ == cmd_name][0]
-            cmd = cmd_class(**c[cmd_name])
-            new_commands.append(cmd)
 
-    return new_commands
+def completed_command_items(partial_text):
+    """ Command objects fully received so far in a streamed CommandPromptOutput JSON response
+
+    Partial parsing keeps an incomplete trailing object, so the last item is held back
+    until the next one starts or the response is complete
+    """
+    if not partial_text.strip():
+        return []
+    return from_json(partial_text, allow_partial=True).get("commands", [])[:-1]
+
+
+# Simple inputs that map straight to commands, handled without an LLM call.
+# Each pattern must match the whole input, so "arm and takeoff 20" still goes to the LLM.
+# Altitudes are unsigned, and a builder returns None for a zero altitude so the LLM handles it
+_NUM = r"(-?\d+(?:\.\d+)?)"
+_ALT = r"(\d+(?:\.\d+)?)"
+QUICK_CMDS = [
+    (re.compile(r"arm", re.I), lambda m: [cmd_Arm(arm=True)]),
+    (re.compile(r"disarm", re.I), lambda m: [cmd_Arm(arm=False)]),
+    (re.compile(rf"takeoff(?:\s+(?:to\s+)?{_ALT}\s*m?)?", re.I),
+        lambda m: None if m[1] and float(m[1]) <= 0 else [cmd_Takeoff(alt=float(m[1])) if m[1] else cmd_Takeoff()]),
+    (re.compile(r"rtl|return to launch", re.I), lambda m: [cmd_SetMode(mode="RTL")]),
+    (re.compile(rf"goto\s+{_NUM}[\s,]+{_NUM}(?:[\s,]+{_ALT})?", re.I),
+        lambda m: None if m[3] and float(m[3]) <= 0 else
+            [cmd_GoToCoords(lat=float(m[1]), lon=float(m[2]), alt=float(m[3]) if m[3] else None)]),
+]
+
+
+def match_quick_commands(user_input):
+    """ Commands for an input matching a QUICK_CMDS pattern, or None if the LLM is needed """
+    text = user_input.strip()
+    for pattern, build in QUICK_CMDS:
+        m = pattern.fullmatch(text)
+        if m:
+            return build(m)  # None if the values need the LLM
+    return None
 
 
 def run_commands(commands, vehicle, verbose=True):
     """ Run the commands on the vehicle if they have a run method """
+    display_lines = []
     for c in commands:
         if hasattr(c, 'run'):
             c.run(vehicle)
@@ -202,11 +299,148 @@ def run_commands(commands, vehicle, verbose=True):
         else:
             display_str = f"Command: {c.__class__.__name__} has no run method."
             
-        if verbose:
-            print(display_str)
-
-
-client = OpenAI()
+        display_lines.append(display_str)
+
+    # One write for the whole command list instead of a line-buffered print per command
+    if verbose and display_lines:
+        sys.stdout.write("\n".join(display_lines) + "\n")
+        sys.stdout.flush()
+
+
+class Backend(Protocol):
+    """ LLM used to parse prompts into the response schema """
+    async def parse(self, prefix: str, user_content: str, text_format: type[BaseModel]) -> dict:
+        """ Returns the simplified LLM response items of interest, with the parsed output under 'parsed' """
+        ...
+
+    async def stream(self, prefix: str, user_content: str, text_format: type[BaseModel], on_command) -> dict:
+        """ Same as parse for CommandPromptOutput, but awaits on_command(wrapped_cmd) for each
+        command as soon as it's complete, before the rest of the response arrives """
+        ...
+
+
+class OpenAIBackend:
+    """ OpenAI Responses API with structured output """
+    def __init__(self, client, model="gpt-4o-mini"):
+        self.client = client
+        self.model = model
+
+    async def parse(self, prefix, user_content, text_format):
+        start_time = time.time()
+
+        response = await self.client.responses.parse(
+            model=self.model,
+            input=[
+                {"role": "system", "content": prefix},
+                {"role": "user", "content": user_content},
+            ],
+            text_format=text_format,
+            temperature=0.0,
+            prompt_cache_key=prompt_cache_key
+        )
+
+        # Simplified LLM response items of interest
+        return {
+          "model": response.model,
+          "temperature": response.temperature,
+          "usage": response.usage.model_dump(),
+          "latency": time.time() - start_time,
+          "text": response.output[0].content[0].text,
+          "parsed": response.output_parsed
+        }
+
+    async def stream(self, prefix, user_content, text_format, on_command):
+        start_time = time.time()
+        text = ""
+        sent = 0
+
+        async with self.client.responses.stream(
+            model=self.model,
+            input=[
+                {"role": "system", "content": prefix},
+                {"role": "user", "content": user_content},
+            ],
+            text_format=text_format,
+            temperature=0.0,
+            prompt_cache_key=prompt_cache_key
+        ) as stream:
+            async for event in stream:
+                if event.type != "response.output_text.delta":
+                    continue
+                text += event.delta
+
+                # Hand off each command as soon as its object is complete
+                cmd_items = completed_command_items(text)
+                for item in cmd_items[sent:]:
+                    await on_command(WRAPPED_CMD_ADAPTER.validate_python(item))
+                sent = len(cmd_items)
+
+            response = await stream.get_final_response()
+
+        # Any commands not seen complete while streaming
+        for wrapped_cmd in response.output_parsed.commands[sent:] if response.output_parsed else []:
+            await on_command(wrapped_cmd)
+
+        return {
+          "model": response.model,
+          "temperature": response.temperature,
+          "usage": response.usage.model_dump(),
+          "latency": time.time() - start_time,
+          "text": text,
+          "parsed": response.output_parsed
+        }
+
+
+class LocalLlamaBackend:
+    """ Local GGUF model with llama-cpp-python, no network round trip
+
+    Decoding is constrained to the response schema's JSON grammar, so every
+    response is valid for the schema
+    """
+    def __init__(self, model_path, n_ctx=4096):
+        from llama_cpp import Llama
+        self.model = os.path.basename(model_path)
+        self.llm = Llama(model_path=model_path, n_ctx=n_ctx, chat_format="chatml", verbose=False)
+
+    async def parse(self, prefix, user_content, text_format):
+        start_time = time.time()
+
+        # llama.cpp inference is blocking and CPU/GPU bound, keep it off the event loop
+        result = await asyncio.to_thread(
+            self.llm.create_chat_completion,
+            messages=[
+                {"role": "system", "content": prefix},
+                {"role": "user", "content": user_content},
+            ],
+            response_format={"type": "json_object", "schema": text_format.model_json_schema()},
+            temperature=0.0
+        )
+        text = result["choices"][0]["message"]["content"]
+
+        return {
+          "model": self.model,
+          "temperature": 0.0,
+          "usage": result["usage"],
+          "latency": time.time() - start_time,
+          "text": text,
+          "parsed": text_format.model_validate_json(text)
+        }
+
+    async def stream(self, prefix, user_content, text_format, on_command):
+        # Local inference has no network wait to overlap, so hand off the commands after the full parse
+        simple_response = await self.parse(prefix, user_content, text_format)
+        for wrapped_cmd in simple_response["parsed"].commands:
+            await on_command(wrapped_cmd)
+        return simple_response
+
+
+if os.environ.get("LOCAL_MODEL_PATH"):
+    http_client = None
+    backend = LocalLlamaBackend(os.environ["LOCAL_MODEL_PATH"])
+else:
+    # One shared HTTP/2 connection pool, concurrent LLM calls are multiplexed over kept-alive connections
+    http_client = DefaultAsyncHttpxClient(http2=True, limits=httpx.Limits(max_keepalive_connections=32))
+    backend = OpenAIBackend(AsyncOpenAI(http_client=http_client, timeout=30.0))
 
 prompt_template = """
 You are a drone control system. Your task is to convert user input into 
@@ -221,88 +455,187 @@ Documentation and formatting for commands are:
 
 {cmds_doc}
 
-The user input is: 
-
-{user_input}
+The user input is provided in the next message.
 
 Steps if input includes commands:
     1. Parse the user input to identify:
         - Individual actions requested in the input
         - The command best suited for each action
 
-    2. Use the command class documents to create JSON for each command
+    2. Use the command class documents to create a command object for each command
 
 Finally, return your response as CommandPromptOutput object:
     - speech_response: The response text, suitable for STT output
-    - commands: commands as JSON that can be unpacked into pydantic objects
+    - commands: command objects keyed by command name, as in the examples
     
 """
 
+batch_prompt_template = """
+You are a drone control system. Your task is to convert a batch of numbered
+user inputs into structured commands for the drone.
+
+Handle each user input separately and in order, as if it was sent on its own.
+For each input, decide if it is a command or a question.
+If it's a command, parse it into structured commands.
+If it's a question, respond with a simple operational response based
+your general knowledge, especially about drone operations.
+
+Documentation and formatting for commands are:
+
+{cmds_doc}
+
+The numbered user inputs are provided in the next message.
+
+Steps for each input that includes commands:
+    1. Parse the user input to identify:
+        - Individual actions requested in the input
+        - The command best suited for each action
+
+    2. Use the command class documents to create a command object for each command
+
+Finally, return your response as BatchedCommandPromptOutput object, with
+one CommandPromptOutput item per user input, in the same order:
+    - speech_response: The response text, suitable for STT output
+    - commands: command objects keyed by command name, as in the examples
+
+"""
+
 system_prompt = """ 
 You are an AI copilot for drone operations. 
 Speak ultra-concisely with an operational tone.
 """
 
-all_cmds = [
-    cmd_SetMode, 
-    cmd_Arm, 
-    cmd_GoToCoords, 
-    cmd_Takeoff, 
-    cmd_GoToLocal, 
-    cmd_SetHeading
-    ]
+user_prompt_template = """
+The user input is: 
+
+{user_input}
+"""
+
+batch_user_prompt_template = """
+The user inputs are:
+
+{user_inputs}
+"""
+
 
 cmds_doc = "\n\n".join([_cmd.__doc__ for _cmd in all_cmds])
 
-while True:
 
-    new_commands = []
+# Static prompt prefixes, sent byte-identical on every call so OpenAI can serve them from its prompt cache.
+# Only the user input changes between calls, and goes in the last message
+prompt_prefix = system_prompt + prompt_template.format(cmds_doc=cmds_doc)
+batch_prompt_prefix = system_prompt + batch_prompt_template.format(cmds_doc=cmds_doc)
 
-    user_input = input("\nEnter command: ")
+# Cache key versioned by the command docs, so cached prefixes aren't reused after the command set changes
+prompt_cache_key = "flight_manual-" + hashlib.sha256(cmds_doc.encode()).hexdigest()[:16]
 
-    if user_input.lower() == "exit":
-        break
+# User prompts split around their input slot once, so each call is a plain concat with no template parsing
+user_prompt_head, _, user_prompt_tail = user_prompt_template.partition("{user_input}")
+batch_user_prompt_head, _, batch_user_prompt_tail = batch_user_prompt_template.partition("{user_inputs}")
 
-    # print(prompt_template.format(cmds_doc=cmds_doc, user_input=user_input))
 
-    start_time = time.time()
+async def dispatcher(command_queue, vehicle):
+    """ Run parsed command lists from the queue on the vehicle, in order
 
-    response = client.responses.parse(
-        model="gpt-4o-mini",
-        input=[
-            {"role": "system", "content": system_prompt},
-            {
-                "role": "user",
-                "content": prompt_template.format(
-                    cmds_doc=cmds_doc, 
-                    user_input=user_input
-                    )
-            },
-        ],
-        text_format=CommandPromptOutput,
-        temperature=0.0
-        
+    Runs in a worker thread so MAVLink sends don't block the next LLM call
+    """
+    while True:
+        commands = await command_queue.get()
+        try:
+            await asyncio.to_thread(run_commands, commands, vehicle)
+        except Exception as e:
+            # Keep consuming, or the rest of the queue never runs and join() at exit hangs
+            print(f"Commands failed, continuing with the next: {e}")
+        finally:
+            command_queue.task_done()
+
+
+async def run_batch(backend, user_inputs, command_queue, verbose=True):
+    """ Parse several user inputs with a single LLM call, then queue their commands in order """
+    user_inputs = [i.strip() for i in user_inputs if i.strip()]
+    if not user_inputs:
+        return None
+
+    simple_response = await backend.parse(
+        batch_prompt_prefix,
+        batch_user_prompt_head
+            + "\n".join(f"{n}. {i}" for n, i in enumerate(user_inputs, 1))
+            + batch_user_prompt_tail,
+        BatchedCommandPromptOutput
     )
 
-    # Simplified LLM response items of interest
-    simple_response = {
-      "model": response.model,
-      "temperature": response.temperature,
-      "usage": response.usage.model_dump(),
-      "latency": time.time() - start_time,
-      "text": response.output[0].content[0].text,
-      "parsed": response.output_parsed
-    }
-  
-    print(f"\nResponse Params:")
-    print(f"  Model: {simple_response['model']}")
-    print(f"  Temperature: {simple_response['temperature']}")
-    print(f"  Usage: {simple_response['usage']}")
-    print(f"  Latency: {simple_response["latency"]:.2f} seconds")
-
-    if simple_response["parsed"]:
-        print(f"  Speech Response: {simple_response["parsed"].speech_response}")
-        print(f"  Commands: {simple_response["parsed"].commands}")
-    
-    new_commands = parse_response_to_commands(response, all_cmds)
-    run_commands(new_commands, vehicle)
+    if verbose:
+        print(f"\nBatch Response Params:")
+        print(f"  Inputs: {len(user_inputs)}")
+        print(f"  Usage: {simple_response['usage']}")
+        print(f"  Latency: {simple_response['latency']:.2f} seconds")
+
+    if not simple_response["parsed"]:
+        return simple_response
+
+    for user_input, output in zip(user_inputs, simple_response["parsed"].items):
+        if verbose:
+            print(f"\n  Input: {user_input}")
+            print(f"  Speech Response: {output.speech_response}")
+            print(f"  Commands: {output.commands}")
+        await command_queue.put(parse_output_to_commands(output))
+
+    return simple_response
+
+
+async def main():
+    # Commands are sent to the vehicle in the background while the next input is parsed
+    command_queue = asyncio.Queue()
+    dispatch_task = asyncio.create_task(dispatcher(command_queue, vehicle))
+
+    while True:
+
+        user_input = await asyncio.to_thread(input, "\nEnter command: ")
+
+        if user_input.lower() == "exit":
+            break
+
+        # Send several inputs in one LLM call, ie "batch: arm; takeoff to 20m; turn left 90"
+        if user_input.lower().startswith("batch:"):
+            await run_batch(backend, user_input[6:].split(";"), command_queue)
+            continue
+
+        # Skip the LLM for simple inputs like "arm", "takeoff 20" or "rtl", unless run with --force-llm
+        quick_cmds = None if FORCE_LLM else match_quick_commands(user_input)
+        if quick_cmds:
+            print("\nMatched locally, LLM skipped")
+            await command_queue.put(quick_cmds)
+            continue
+
+        # print(prompt_prefix + user_prompt_head + user_input + user_prompt_tail)
+
+        # Commands are queued as soon as they stream in, while the rest of the response is generated
+        async def queue_command(wrapped_cmd):
+            await command_queue.put(unwrap_commands([wrapped_cmd]))
+
+        simple_response = await backend.stream(
+            prompt_prefix,
+            user_prompt_head + user_input + user_prompt_tail,
+            CommandPromptOutput,
+            queue_command
+        )
+      
+        print(f"\nResponse Params:")
+        print(f"  Model: {simple_response['model']}")
+        print(f"  Temperature: {simple_response['temperature']}")
+        print(f"  Usage: {simple_response['usage']}")
+        print(f"  Latency: {simple_response["latency"]:.2f} seconds")
+
+        if simple_response["parsed"]:
+            print(f"  Speech Response: {simple_response["parsed"].speech_response}")
+            print(f"  Commands: {simple_response["parsed"].commands}")
+
+    # Let any queued commands finish before exiting
+    await command_queue.join()
+    dispatch_task.cancel()
+
+    if http_client:
+        await http_client.aclose()
+
+
+asyncio.run(main())
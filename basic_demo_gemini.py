@@ -18,13 +18,23 @@ strucutured output
 
 """
 import os
-import json
+import re
+import sys
+import copy
+import functools
+import hashlib
+import math
 from pathlib import Path
 import time
+import asyncio
+import threading
 
+import httpx
 from google import genai
+from google.genai import errors
 from typing import Literal, Optional, List, TypedDict, Union
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, create_model
+from pydantic_core import from_json
 
 print("If dronekit fails to import, see fix here:\n",
       'https://github.com/igsxf22/flight_manual?tab=readme-ov-file#fix-dronekit-import-issue')
@@ -35,6 +45,30 @@ from dronekit import connect, VehicleMode, LocationGlobal, LocationGlobalRelativ
 
 os.environ["GEMINI_API_KEY"] = '<Your Gemini API Key or Retrieve Key Method Here>'
 
+# Run with --force-llm to send every input to the LLM, ie to compare against the regex fast path
+FORCE_LLM = "--force-llm" in sys.argv
+
+# Prebuilt MAVLink messages for the commands, with the constant fields filled once at import
+# Body-frame local target, type_mask enables only the velocity fields; vx/vy/vz are set per command
+_LOCAL_TARGET_MSG = mavutil.mavlink.MAVLink_set_position_target_local_ned_message(
+    0, 0, 0, mavutil.mavlink.MAV_FRAME_BODY_OFFSET_NED,
+    0b0000111111000111, 0, 0, 0,
+    0, 0, 0,
+    0, 0, 0, 0, 0)
+
+# CONDITION_YAW command_long, called with the 7 params
+condition_yaw_msg = functools.partial(
+    mavutil.mavlink.MAVLink_command_long_message,
+    0, 0, mavutil.mavlink.MAV_CMD_CONDITION_YAW, 0)
+
+
+def send_local_target(vehicle, x, y, z):
+    """ Send a body-frame (FRD) local target, reusing the prebuilt message """
+    msg = copy.copy(_LOCAL_TARGET_MSG)
+    msg.vx, msg.vy, msg.vz = x, y, z
+    vehicle.send_mavlink(msg)
+
+
 # Commands: Pydantic objects with typed fields and a method to run the command with Dronekit
 class cmd_GoToCoords(BaseModel):
     """ 
@@ -47,18 +81,20 @@ class cmd_GoToCoords(BaseModel):
             {lat: float, lon: float, alt: Optional[float], frame: Literal["Relative", "Global"]}
         example: {"cmd_GoTo": {"lat": 38.9605, "lon": -77.3118, "alt": 20, "frame": "Relative"}}
     """
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
     lat: float = Field(..., description="Destination latitude, dec degrees")
     lon: float = Field(..., description="Destination longitude, dec degrees")
     alt: Optional[float] = Field(None, description="meters")
     frame: Literal["Relative", "Global"] = Field("Relative", description="Reference frame for the altitude")
 
     def run(self, vehicle):
-        if self.alt is None:
-            self.alt = vehicle.location.global_relative_frame.alt
+        # Commands are frozen, so hold current altitude in a local instead of setting self.alt
+        alt = vehicle.location.global_relative_frame.alt if self.alt is None else self.alt
         if self.frame == "Relative":
-            dest = LocationGlobalRelative(self.lat, self.lon, self.alt)
+            dest = LocationGlobalRelative(self.lat, self.lon, alt)
         elif self.frame == "Global":
-            dest = LocationGlobal(self.lat, self.lon, self.alt)
+            dest = LocationGlobal(self.lat, self.lon, alt)
         vehicle.simple_goto(dest)
         
 
@@ -71,13 +107,26 @@ class cmd_Takeoff(BaseModel):
         values: {"alt": float}
         example: {"cmd_Takeoff": {"alt": 10}}
     """
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
     alt: float = Field(10., description="meters")
 
     def run(self, vehicle):
-        vehicle.simple_takeoff(self.alt)
-        while not vehicle.location.global_relative_frame.alt>=self.alt*0.95:
-            print(" Taking off... Altitude: ", vehicle.location.global_relative_frame.alt)
-            time.sleep(1) 
+        # Wake on the altitude update that reaches target, instead of polling once a second
+        reached = threading.Event()
+
+        def on_altitude(_vehicle, _attr_name, location):
+            if location.alt is not None and location.alt >= self.alt*0.95:
+                reached.set()
+
+        vehicle.add_attribute_listener('location.global_relative_frame', on_altitude)
+        try:
+            vehicle.simple_takeoff(self.alt)
+            while not reached.wait(1):
+                # Overwrite the progress line instead of printing a new line each second
+                print(" Taking off... Altitude: ", vehicle.location.global_relative_frame.alt, end='\r', flush=True)
+        finally:
+            vehicle.remove_attribute_listener('location.global_relative_frame', on_altitude)
 
         # Enable yaw commands with a simple_goto after takeoff
         vehicle.simple_goto(vehicle.location.global_relative_frame)
@@ -94,6 +143,8 @@ class cmd_SetMode(BaseModel):
         values: {"GUIDED", "ALT_HOLD", "RTL", "AUTO"}
         example: {"cmd_SetMode": {"mode": "GUIDED"}}
     """
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
     mode: Literal["GUIDED", "ALT_HOLD", "RTL", "AUTO"]
     
     def run(self, vehicle):
@@ -108,6 +159,8 @@ class cmd_Arm(BaseModel):
         values: {"arm": bool}
         example: {"cmd_Arm": {"arm": True}}
     """
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
     arm: bool    
     
     def run(self, vehicle):
@@ -126,17 +179,14 @@ class cmd_GoToLocal(BaseModel):
         values: {"x": float, "y": float, "z": float}
         example: {"cmd_GoToLocal": {"x": 10, "y": 0, "z": 0}}
     """
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
     x: float = 0
     y: float = 0
     z: float = 0
 
     def run(self, vehicle):
-        msg = vehicle.message_factory.set_position_target_local_ned_encode(
-            0, 0, 0, mavutil.mavlink.MAV_FRAME_BODY_OFFSET_NED,
-            0b0000111111000111, 0, 0, 0,
-            self.x, self.y, -self.z, 
-            0, 0, 0, 0, 0)
-        vehicle.send_mavlink(msg)
+        send_local_target(vehicle, self.x, self.y, -self.z)
         print("Reminder: GoToLocal is not setup for Global frame coordinates, \
               only local FRU frame (ie North=Forward, East=Right)")
 
@@ -151,35 +201,22 @@ class cmd_SetYaw(BaseModel):
         values: {"frame": Literal["Relative", "Global"], "yaw": float}
         example: {"cmd_SetYaw": {"frame": "Relative", "yaw": 25}}
     """
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
     frame: Literal["Relative", "Global"] = Field("Relative", description="Reference frame for the heading")
     yaw: float = Field(..., description="Yaw angle in degrees")
 
     def run(self, vehicle):
         yaw_speed = 90.0  # yaw speed deg/s
 
-        if self.frame == "Relative":
-            is_relative = 1  # yaw relative to current heading
-            if self.yaw >= 0:
-                direction = 1  # clockwise
-            else:
-                direction = -1  # counter-clockwise
-            target_yaw = abs(self.yaw)
-        
-        elif self.frame == "Global":
-            is_relative = 0  # yaw is an absolute angle
-            current_yaw = vehicle.heading  # current heading in degrees
-            target_yaw = self.yaw % 360  # normalize target yaw to [0, 360)
-
-            # Calculate shortest direction
-            delta_yaw = (target_yaw - current_yaw + 540) % 360 - 180
-            if delta_yaw > 0:
-                direction = 1  # clockwise
-            else:
-                direction = -1  # counter-clockwise
-           
+        is_relative = int(self.frame == "Relative")  # relative to current heading (1) or absolute angle (0)
+        # Relative: turn by yaw. Global: shortest turn from current heading to yaw, in [-180, 180)
+        delta_yaw = self.yaw if is_relative else (self.yaw - vehicle.heading + 540) % 360 - 180
+        direction = int(math.copysign(1, delta_yaw))  # clockwise (1) or counter-clockwise (-1)
+        target_yaw = abs(delta_yaw) if is_relative else self.yaw % 360  # offset, or heading in [0, 360)
+
         # Create the CONDITION_YAW command
-        msg = vehicle.message_factory.command_long_encode(
-            0, 0, mavutil.mavlink.MAV_CMD_CONDITION_YAW, 0,
+        msg = condition_yaw_msg(
             target_yaw,   # param1: angle or relative offset
             yaw_speed,    # param2: yaw speed
             direction,    # param3: direction (-1 ccw, 1 cw)
@@ -188,39 +225,96 @@ class cmd_SetYaw(BaseModel):
         )
         vehicle.send_mavlink(msg)
 
+
+all_cmds = [
+    cmd_SetMode, 
+    cmd_Arm, 
+    cmd_GoToCoords, 
+    cmd_Takeoff, 
+    cmd_GoToLocal, 
+    cmd_SetYaw
+    ]
+
+# Each command is a single-key object named by its class, ie {"cmd_Arm": {"arm": true}}, as in the command docs
+WrappedCmd = Union[tuple(
+    create_model(f"Wrapped_{_cmd.__name__}", __config__=ConfigDict(extra='forbid'), **{_cmd.__name__: (_cmd, ...)})
+    for _cmd in all_cmds
+)]
+
+# Validator built once at import, for command objects received while streaming
+WRAPPED_CMD_ADAPTER = TypeAdapter(WrappedCmd)
+
 class CommandPromptOutput(BaseModel):
     """ Response from the LLM """
     speech_response: str = Field(
         ..., 
         description="A concise, simple operational response/acknowledgement from one pilot to another"
     )
-    commands: List[str] = Field(
+    commands: List[WrappedCmd] = Field(
         ..., 
         description="List of commands parsed from the input"
     )
 
 
-def parse_response_to_commands(response, available_cmds):
-    """ Parse the response to runnable commands """
-    cmds = response.parsed.commands
-    cmds = [json.loads(i) for i in cmds]
-    new_commands = []
-    for c in cmds:
-        cmd_name = list(c.keys())[0]
+class BatchedCommandPromptOutput(BaseModel):
+    """ Response from the LLM for a batch of user inputs """
+    items: List[CommandPromptOutput] = Field(
+        ...,
+        description="One response per user input, in the same order as the inputs"
+    )
+
+
+def parse_output_to_commands(output):
+    """ Parse a single CommandPromptOutput to runnable commands """
+    return unwrap_commands(output.commands)
 
-        # If the command name is in the list of all commands
-        if cmd_name in [cmd.__name__ for cmd in available_cmds]:
 
-            # ... Create an instance of the command class
-            cmd_class = [cmd for cmd in available_cmds if cmd.__name__ == cmd_name][0]
-            cmd = cmd_class(**c[cmd_name])
-            new_commands.append(cmd)
+def unwrap_commands(wrapped_cmds):
+    """ Runnable commands from their single-key WrappedCmd objects """
+    return [cmd for wrapped in wrapped_cmds for _, cmd in wrapped]
 
-    return new_commands
+
+def completed_command_items(partial_text):
+    """ Command objects fully received so far in a streamed CommandPromptOutput JSON response
+
+    Partial parsing keeps an incomplete trailing object, so the last item is held back
+    until the next one starts or the response is complete
+    """
+    if not partial_text.strip():
+        return []
+    return from_json(partial_text, allow_partial=True).get("commands", [])[:-1]
+
+
+# Simple inputs that map straight to commands, handled without an LLM call.
+# Each pattern must match the whole input, so "arm and takeoff 20" still goes to the LLM.
+# Altitudes are unsigned, and a builder returns None for a zero altitude so the LLM handles it
+_NUM = r"(-?\d+(?:\.\d+)?)"
+_ALT = r"(\d+(?:\.\d+)?)"
+QUICK_CMDS = [
+    (re.compile(r"arm", re.I), lambda m: [cmd_Arm(arm=True)]),
+    (re.compile(r"disarm", re.I), lambda m: [cmd_Arm(arm=False)]),
+    (re.compile(rf"takeoff(?:\s+(?:to\s+)?{_ALT}\s*m?)?", re.I),
+        lambda m: None if m[1] and float(m[1]) <= 0 else [cmd_Takeoff(alt=float(m[1])) if m[1] else cmd_Takeoff()]),
+    (re.compile(r"rtl|return to launch", re.I), lambda m: [cmd_SetMode(mode="RTL")]),
+    (re.compile(rf"goto\s+{_NUM}[\s,]+{_NUM}(?:[\s,]+{_ALT})?", re.I),
+        lambda m: None if m[3] and float(m[3]) <= 0 else
+            [cmd_GoToCoords(lat=float(m[1]), lon=float(m[2]), alt=float(m[3]) if m[3] else None)]),
+]
+
+
+def match_quick_commands(user_input):
+    """ Commands for an input matching a QUICK_CMDS pattern, or None if the LLM is needed """
+    text = user_input.strip()
+    for pattern, build in QUICK_CMDS:
+        m = pattern.fullmatch(text)
+        if m:
+            return build(m)  # None if the values need the LLM
+    return None
 
 
 def run_commands(commands, vehicle, verbose=True):
     """ Run the commands on the vehicle if they have a run method """
+    display_lines = []
     for c in commands:
         if hasattr(c, 'run'):
             c.run(vehicle)
@@ -228,8 +322,12 @@ def run_commands(commands, vehicle, verbose=True):
         else:
             display_str = f"Command: {c.__class__.__name__} has no run method."
             
-        if verbose:
-            print(display_str)
+        display_lines.append(display_str)
+
+    # One write for the whole command list instead of a line-buffered print per command
+    if verbose and display_lines:
+        sys.stdout.write("\n".join(display_lines) + "\n")
+        sys.stdout.flush()
 
 prompt_template = """
 You are a drone control system. Your task is to convert user input into 
@@ -244,88 +342,328 @@ Documentation and formatting for commands are:
 
 {cmds_doc}
 
-The user input is: 
-
-{user_input}
+The user input is provided at the end of the prompt.
 
 Steps if input includes commands:
     1. Parse the user input to identify:
         - Individual actions requested in the input
         - The command best suited for each action
 
-    2. Use the command class documents to create JSON string for each command
+    2. Use the command class documents to create a command object for each command
 Return a JSON object with two fields:
 - "speech_response": A concise, simple operational response/acknowledgement from one pilot to another
-- "commands": A list of JSON strings, each representing a command to be executed
+- "commands": A list of command objects, each keyed by its command name as in the examples
 The response should be in the following JSON format:
 {{
     "speech_response": "<concise operational response>",
     "commands": [
-        "<JSON string of command 1>",
-        "<JSON string of command 2>",
+        {{"<command name>": {{<command 1 values>}}}},
+        {{"<command name>": {{<command 2 values>}}}},
         ...
     ]
 }}  
 """
 
+batch_prompt_template = """
+You are a drone control system. Your task is to convert a batch of numbered
+user inputs into structured commands for the drone.
+
+Handle each user input separately and in order, as if it was sent on its own.
+For each input, decide if it is a command or a question.
+If it's a command, parse it into structured commands.
+If it's a question, respond with a simple operational response based
+your general knowledge, especially about drone operations.
+
+Documentation and formatting for commands are:
+
+{cmds_doc}
+
+The numbered user inputs are provided at the end of the prompt.
+
+Steps for each input that includes commands:
+    1. Parse the user input to identify:
+        - Individual actions requested in the input
+        - The command best suited for each action
+
+    2. Use the command class documents to create a command object for each command
+Return a JSON object with one field:
+- "items": A list with one object per user input, in the same order, each with two fields:
+    - "speech_response": A concise, simple operational response/acknowledgement from one pilot to another
+    - "commands": A list of command objects, each keyed by its command name as in the examples
+The response should be in the following JSON format:
+{{
+    "items": [
+        {{
+            "speech_response": "<concise operational response to input 1>",
+            "commands": [
+                {{"<command name>": {{<command 1 values>}}}},
+                ...
+            ]
+        }},
+        ...
+    ]
+}}
+"""
+
 system_prompt = """ 
 You are an AI copilot for drone operations. 
 Speak ultra-concisely with an operational tone.
 """
 
-all_cmds = [
-    cmd_SetMode, 
-    cmd_Arm, 
-    cmd_GoToCoords, 
-    cmd_Takeoff, 
-    cmd_GoToLocal, 
-    cmd_SetYaw
-    ]
+user_prompt_template = """
+The user input is: 
 
-cmds_doc = "\n\n".join([_cmd.__doc__ for _cmd in all_cmds])
+{user_input}
+"""
 
-if __name__ == "__main__":
+batch_user_prompt_template = """
+The user inputs are:
 
+{user_inputs}
+"""
 
-    connection_string = 'tcp:127.0.0.1:5763'
-    vehicle = connect(connection_string, wait_ready=True, baud=57600, rate=60)
-    vehicle.mode = "GUIDED"
-    print("Vehicle Connected.")
 
+cmds_doc = "\n\n".join([_cmd.__doc__ for _cmd in all_cmds])
 
-    client = genai.Client(
-        api_key=os.getenv("GEMINI_API_KEY"),
-    )
 
-    while True:
+# Static prompt prefixes, cached server-side at startup so only the user input is sent per call
+prompt_prefix = system_prompt + prompt_template.format(cmds_doc=cmds_doc)
+batch_prompt_prefix = system_prompt + batch_prompt_template.format(cmds_doc=cmds_doc)
 
-        new_commands = []
+# Cache name versioned by the command docs, so cached prefixes aren't reused after the command set changes
+prompt_cache_key = "flight_manual-" + hashlib.sha256(cmds_doc.encode()).hexdigest()[:16]
 
-        user_input = input("\nEnter command: ")
+# User prompts split around their input slot once, so each call is a plain concat with no template parsing
+user_prompt_head, _, user_prompt_tail = user_prompt_template.partition("{user_input}")
+batch_user_prompt_head, _, batch_user_prompt_tail = batch_user_prompt_template.partition("{user_inputs}")
 
-        if user_input.lower() == "exit":
-            break
 
-        # print(prompt_template.format(cmds_doc=cmds_doc, user_input=user_input))
+# Prompt cache lifetime, refreshed at half this interval so long sessions don't outlive it
+PROMPT_CACHE_TTL = 3600
 
-        start_time = time.time()
 
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-lite",
-            contents=prompt_template.format(
-                cmds_doc=cmds_doc, 
-                user_input=user_input
-                ),
+async def create_prompt_cache(client, prefix, name, model="gemini-2.5-flash-lite", ttl=f"{PROMPT_CACHE_TTL}s"):
+    """ Cache a static prompt prefix server-side, returns the cache name
+
+    Gemini only caches prompts above a minimum token count, so returns None
+    if the cache can't be created and the prefix is sent with each call instead
+    """
+    try:
+        cache = await client.aio.caches.create(
+            model=model,
             config={
-                'temperature': 0.0,
-                "response_mime_type": "application/json",
-                "response_schema": CommandPromptOutput,
+                "display_name": f"{prompt_cache_key}-{name}",
+                "system_instruction": prefix,
+                "ttl": ttl,
             },
         )
+    except Exception as e:
+        print(f"Prompt cache '{name}' not created, sending full prompt with each call: {e}")
+        return None
+    return cache.name
 
-        print("\nLLM Response:")
+
+async def refresh_prompt_caches(client, caches, ttl=f"{PROMPT_CACHE_TTL}s"):
+    """ Extend the prompt caches' TTL before they expire, dropping any that can't be refreshed """
+    while True:
+        await asyncio.sleep(PROMPT_CACHE_TTL / 2)
+        for name, cache_name in caches.items():
+            if not cache_name:
+                continue
+            try:
+                await client.aio.caches.update(name=cache_name, config={"ttl": ttl})
+            except Exception as e:
+                print(f"Prompt cache '{name}' not refreshed, sending full prompt with each call: {e}")
+                caches[name] = None
+
+
+async def with_prompt_cache(caches, name, call):
+    """ Await call(cache_name), retrying once with the full prompt if the cached call is rejected,
+    ie the cache expired or was deleted server-side """
+    cache_name = caches[name]
+    if not cache_name:
+        return await call(None)
+    try:
+        return await call(cache_name)
+    except errors.ClientError as e:
+        print(f"Prompt cache '{name}' rejected, sending full prompt with each call: {e}")
+        caches[name] = None
+        return await call(None)
+
+
+def prompt_config(response_schema, prefix, cache_name=None):
+    """ Build the generate_content config, using the cached prefix if available """
+    config = {
+        'temperature': 0.0,
+        "response_mime_type": "application/json",
+        "response_schema": response_schema,
+    }
+    if cache_name:
+        config["cached_content"] = cache_name
+    else:
+        config["system_instruction"] = prefix
+    return config
+
+
+async def dispatcher(command_queue, vehicle):
+    """ Run parsed command lists from the queue on the vehicle, in order
+
+    Runs in a worker thread so MAVLink sends (and the takeoff wait) don't block the next LLM call
+    """
+    while True:
+        commands = await command_queue.get()
+        try:
+            await asyncio.to_thread(run_commands, commands, vehicle)
+        except Exception as e:
+            # Keep consuming, or the rest of the queue never runs and join() at exit hangs
+            print(f"Commands failed, continuing with the next: {e}")
+        finally:
+            command_queue.task_done()
+
+
+async def run_batch(client, user_inputs, command_queue, cache_name=None, verbose=True):
+    """ Parse several user inputs with a single LLM call, then queue their commands in order """
+    user_inputs = [i.strip() for i in user_inputs if i.strip()]
+    if not user_inputs:
+        return None
+
+    response = await client.aio.models.generate_content(
+        model="gemini-2.5-flash-lite",
+        contents=batch_user_prompt_head
+            + "\n".join(f"{n}. {i}" for n, i in enumerate(user_inputs, 1))
+            + batch_user_prompt_tail,
+        config=prompt_config(BatchedCommandPromptOutput, batch_prompt_prefix, cache_name),
+    )
+
+    if verbose:
+        print("\nLLM Batch Response:")
         print(response.parsed.model_dump_json(indent=2))
 
-        
-        new_commands = parse_response_to_commands(response, all_cmds)
-        run_commands(new_commands, vehicle)
+    for output in response.parsed.items:
+        await command_queue.put(parse_output_to_commands(output))
+
+    return response
+
+
+async def stream_commands(client, user_content, config, on_command):
+    """ Stream a CommandPromptOutput response, awaiting on_command(wrapped_cmd) for each command
+    as soon as it's complete, before the rest of the response arrives """
+    text = ""
+    sent = 0
+
+    async for chunk in await client.aio.models.generate_content_stream(
+        model="gemini-2.5-flash-lite",
+        contents=user_content,
+        config=config,
+    ):
+        text += chunk.text or ""
+
+        cmd_items = completed_command_items(text)
+        for item in cmd_items[sent:]:
+            await on_command(WRAPPED_CMD_ADAPTER.validate_python(item))
+        sent = len(cmd_items)
+
+    parsed = CommandPromptOutput.model_validate_json(text)
+
+    # Any commands not seen complete while streaming
+    for wrapped_cmd in parsed.commands[sent:]:
+        await on_command(wrapped_cmd)
+
+    return parsed
+
+
+async def main(client, vehicle, http_client=None):
+    # Commands are sent to the vehicle in the background while the next input is parsed
+    command_queue = asyncio.Queue()
+    dispatch_task = asyncio.create_task(dispatcher(command_queue, vehicle))
+
+    caches = dict(zip(("single", "batch"), await asyncio.gather(
+        create_prompt_cache(client, prompt_prefix, "single"),
+        create_prompt_cache(client, batch_prompt_prefix, "batch"),
+    )))
+    refresh_task = asyncio.create_task(refresh_prompt_caches(client, caches))
+
+    try:
+        while True:
+
+            user_input = await asyncio.to_thread(input, "\nEnter command: ")
+
+            if user_input.lower() == "exit":
+                break
+
+            # Send several inputs in one LLM call, ie "batch: arm; takeoff to 20m; turn left 90"
+            if user_input.lower().startswith("batch:"):
+                batch_inputs = user_input[6:].split(";")
+                await with_prompt_cache(caches, "batch", lambda cache_name: run_batch(
+                    client, batch_inputs, command_queue, cache_name
+                ))
+                continue
+
+            # Skip the LLM for simple inputs like "arm", "takeoff 20" or "rtl", unless run with --force-llm
+            quick_cmds = None if FORCE_LLM else match_quick_commands(user_input)
+            if quick_cmds:
+                print("\nMatched locally, LLM skipped")
+                await command_queue.put(quick_cmds)
+                continue
+
+            # print(prompt_prefix + user_prompt_head + user_input + user_prompt_tail)
+
+            start_time = time.time()
+
+            # Commands are queued as soon as they stream in, while the rest of the response is generated
+            async def queue_command(wrapped_cmd):
+                await command_queue.put(unwrap_commands([wrapped_cmd]))
+
+            parsed = await with_prompt_cache(caches, "single", lambda cache_name: stream_commands(
+                client,
+                user_prompt_head + user_input + user_prompt_tail,
+                prompt_config(CommandPromptOutput, prompt_prefix, cache_name),
+                queue_command
+            ))
+
+            print("\nLLM Response:")
+            print(parsed.model_dump_json(indent=2))
+
+        # Let any queued commands finish before exiting
+        await command_queue.join()
+
+    finally:
+        dispatch_task.cancel()
+        refresh_task.cancel()
+
+        # Caches are billed for storage until deleted or expired
+        for name, cache_name in caches.items():
+            if not cache_name:
+                continue
+            try:
+                await client.aio.caches.delete(name=cache_name)
+            except Exception as e:
+                print(f"Prompt cache '{name}' not deleted: {e}")
+
+        # The client doesn't close a custom httpx client itself
+        if http_client:
+            await http_client.aclose()
+
+
+if __name__ == "__main__":
+
+
+    connection_string = 'tcp:127.0.0.1:5763'
+    vehicle = connect(connection_string, wait_ready=True, baud=57600, rate=60)
+    vehicle.mode = "GUIDED"
+    print("Vehicle Connected.")
+
+
+    # One shared HTTP/2 connection pool, concurrent LLM calls are multiplexed over kept-alive connections
+    http_client = httpx.AsyncClient(
+        http2=True,
+        timeout=30.0,
+        limits=httpx.Limits(max_keepalive_connections=32),
+    )
+
+    client = genai.Client(
+        api_key=os.getenv("GEMINI_API_KEY"),
+        http_options={"timeout": 30000, "httpx_async_client": http_client},
+    )
+
+    asyncio.run(main(client, vehicle, http_client))
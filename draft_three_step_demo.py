@@ -13,38 +13,47 @@ Steps
     b. start any new continuous
     c. conditional will run in separate thread, converted to immediate when condition met
 
+Steps 1 and 2 run as one mini call, nano step 1 is kept as a fallback
+
 Doesn't use chat history yet
 Connects to vehicle, but does not implement cmd execution yet or pass vehicle state into prompts
 Executing commands and using vehicle state will be similar to basic_demo.py
 """
 
 import os
+import math
 import time
-import json
+import asyncio
+import threading
 import openai
+from array import array
 from pathlib import Path
-from typing_extensions import TypedDict, List, Literal, Optional
+from typing_extensions import TypedDict, NamedTuple, ClassVar, List, Literal, Optional
 from pydantic import BaseModel, Field
-from dronekit import connect, Vehicle, VehicleMode, LocationGlobalRelative, LocationLocal
+from pydantic_core import from_json, to_json
+from dronekit import connect, Vehicle, LocationGlobalRelative, LocationLocal
 
-# Connect to the vehicle
-vehicle = connect('tcp:127.0.0.1:5763', wait_ready=True, baud=57600)
+# Connect to the vehicle, waiting only for the telemetry used here instead of the full parameter download
+vehicle = connect('tcp:127.0.0.1:5763', wait_ready=False, baud=57600)
+vehicle.wait_ready(
+    'mode', 'armed', 'location.global_relative_frame', 'location.global_frame', 'groundspeed',
+    timeout=30
+)
 
 # Load API keys from a JSON file
 API_KEY = input("Enter your API key (Or, add your own code to replace this step in line 33:  ")
 os.environ["OPENAI_API_KEY"] = API_KEY
 
 # Create an OpenAI client
-client = openai.Client()
+client = openai.AsyncOpenAI()
+
+# Max concurrent LLM calls, when batched inputs are classified together, to respect rate limits
+LLM_LIMIT = asyncio.Semaphore(8)
 
-# Create message hist
-MESSAGES = [
-    {
-        "role": "system", 
-        "content": """You are a copilot for drone operations. Respond to the user input. 
-        Maintain a professional, operational, but helpful tone."""
-     }
-]
+# System prompt, sent in the instructions slot with only the current user message since chat history isn't used yet.
+# Instructions aren't carried over by previous_response_id, so every call passes them
+SYSTEM_PROMPT = """You are a copilot for drone operations. Respond to the user input. 
+    Maintain a professional, operational, but helpful tone."""
 
 # Building blocks
 class llmEval(TypedDict):
@@ -52,35 +61,91 @@ class llmEval(TypedDict):
     total_tokens: int
     time: float
 
-class VehicleStatus(TypedDict):
-    mode: VehicleMode
+class VehicleStatus(NamedTuple):
+    mode: str
     armed: bool
     lat: float
     lon: float
     rel_alt: float
     abs_alt: float
-    local_xyz: dict[str, float]
+    x: float
+    y: float
+    z: float
     groundspeed: float = 0.0
 
-def get_vehicle_status(vehicle: Vehicle) -> VehicleStatus:
+class TelemetryBuffer:
+    """
+    Latest vehicle telemetry, written by DroneKit's message thread as MAVLink messages arrive,
+    so reading the status doesn't walk DroneKit's attribute chains each time.
+    Numeric fields are kept flat in one preallocated array, in FIELDS order
+    """
+    FIELDS = ("lat", "lon", "rel_alt", "abs_alt", "x", "y", "z", "groundspeed")
+
+    def __init__(self, vehicle: Vehicle):
+        self.lock = threading.Lock()
+        self.mode = vehicle.mode
+        self.armed = vehicle.armed
+        self.values = array("d", [
+            vehicle.location.global_relative_frame.lat or 0.0,
+            vehicle.location.global_relative_frame.lon or 0.0,
+            vehicle.location.global_relative_frame.alt or 0.0,
+            vehicle.location.global_frame.alt or 0.0,
+            vehicle.location.local_frame.north or 0.0,
+            vehicle.location.local_frame.east or 0.0,
+            -(vehicle.location.local_frame.down or 0.0),
+            vehicle.groundspeed or 0.0,
+        ])
+
+        vehicle.add_message_listener("GLOBAL_POSITION_INT", self._on_global_position)
+        vehicle.add_message_listener("LOCAL_POSITION_NED", self._on_local_position)
+        vehicle.add_message_listener("VFR_HUD", self._on_vfr_hud)
+        vehicle.add_attribute_listener("mode", self._on_mode)
+        vehicle.add_attribute_listener("armed", self._on_armed)
+
+    def _on_global_position(self, vehicle, name, msg):
+        with self.lock:
+            self.values[0:4] = array("d", (msg.lat / 1e7, msg.lon / 1e7, msg.relative_alt / 1000, msg.alt / 1000))
+
+    def _on_local_position(self, vehicle, name, msg):
+        with self.lock:
+            self.values[4:7] = array("d", (msg.x, msg.y, -msg.z))
+
+    def _on_vfr_hud(self, vehicle, name, msg):
+        with self.lock:
+            self.values[7] = msg.groundspeed
+
+    def _on_mode(self, vehicle, name, mode):
+        with self.lock:
+            self.mode = mode
+
+    def _on_armed(self, vehicle, name, armed):
+        with self.lock:
+            self.armed = armed
+
+def get_vehicle_status(telemetry: TelemetryBuffer) -> VehicleStatus:
     """
     Get the current status of the vehicle
     """
+    with telemetry.lock:
+        lat, lon, rel_alt, abs_alt, x, y, z, groundspeed = telemetry.values
+        mode, armed = telemetry.mode, telemetry.armed
+
     return VehicleStatus(
-        mode=vehicle.mode,
-        armed=vehicle.armed,
-        lat=vehicle.location.global_relative_frame.lat,
-        lon=vehicle.location.global_relative_frame.lon,
-        rel_alt=vehicle.location.global_relative_frame.alt,
-        abs_alt=vehicle.location.global_frame.alt,
-        local_xyz={
-            "x": vehicle.location.local_frame.north,
-            "y": vehicle.location.local_frame.east,
-            "z": -vehicle.location.local_frame.down
-        },
-        groundspeed=vehicle.groundspeed
+        mode=mode.name,
+        armed=armed,
+        lat=lat,
+        lon=lon,
+        rel_alt=rel_alt,
+        abs_alt=abs_alt,
+        x=x,
+        y=y,
+        z=z,
+        groundspeed=groundspeed
     )
 
+# Kept current in the background from the vehicle's MAVLink messages
+telemetry = TelemetryBuffer(vehicle)
+
 CmdDocumentation = {
     "SetMode": {
         "description": "Set the vehicle mode",
@@ -129,12 +194,17 @@ CmdDocumentation = {
     }
 }
 
+# Serialized once, the docs are static and byte-identical in every step 2 prompt
+CmdDocumentationJSON = to_json(CmdDocumentation, indent=2).decode()
+
 # ---- Steps ----
 class ParseUserInputStep_Input(BaseModel):
     """
     Input template for the user input parser step
     """
-    prompt_template: str = """
+    # Static instructions first and dynamic content last in both step templates,
+    # so the prompt prefix is identical across calls and OpenAI's prompt cache can reuse it
+    prompt_template: ClassVar[str] = """
     You are a copilot for drone operations.
     This is part of a multi-step process to parse user input and determine flight commands
     for an ArduCopter-based vehicle
@@ -147,10 +217,10 @@ class ParseUserInputStep_Input(BaseModel):
     If 2: break down user input steps/elements, and return a list of potential flight commands
     to be validated in the next step, in plain language strings.
 
+    After classifying the user input, return the response in the provided pydantic schema.
+
     User input to be classified:
     {user_input}
-
-    After classifying the user input, return the response in the provided pydantic schema.
     """
     user_input: str = Field(
         ...,
@@ -179,13 +249,18 @@ class ParseCommandsStep_Input(BaseModel):
     """
     Input template for the flight command parser step
     """
-    prompt_template: str = """
+    prompt_template: ClassVar[str] = """
     You are a copilot for drone operations.
     This is part of a multi-step process to parse user input and determine flight commands
     for an ArduCopter-based vehicle
 
-    This is step 2, where the user input has been classified as containing flight commands.
-    You will parse the commands and do these steps:
+    This step classifies the user input into one of two categories:
+        1. Simple response: the user input can be answered with a simple response
+        2. Flight command: the user input likely contains one or more flight commands to be executed
+
+    If 1: set response_type to simple_response, provide a simple response to the user input,
+    and leave the command lists empty.
+    If 2: set response_type to flight_command, then parse the commands and do these steps:
         1. Classify each command by category:
             - Immediate: to be executed immediately
             - Conditional: to be executed based on current or future vehicle state
@@ -195,31 +270,46 @@ class ParseCommandsStep_Input(BaseModel):
            for each command, based on its category and documentation
            - CAUTION: Do not duplicate immediate and continuous commands, continuous has priority
            - WARNING: Do not invent new commands, only use the provided command documentation
+           - For conditions on numeric vehicle telemetry, also give the condition as predicate terms
         4. Return the commands in the provided pydantic schema
 
-    Flight commands to be parsed:
-    {flight_commands}
-
     Command documentation:
     {command_documentation}
-
+    """
+    # Only this part changes between calls, it's sent alone when chained to the stored prefix response
+    input_template: ClassVar[str] = """
+    User input to be parsed:
+    {flight_commands}
     """
     command_list: List[str] = Field(
         ...,
         description="List of strings representing flight commands to be parsed into categories"
     )
-    command_documentation: dict[str, dict] = Field(
-        ...,
-        description="Documentation for available commands, including descriptions and arguments"
+    command_documentation: str = Field(
+        CmdDocumentationJSON,
+        description="JSON documentation for available commands, including descriptions and arguments"
     )
-    def to_prompt(self) -> str:
+    def to_prefix(self) -> str:
         """
-        Convert the input to a prompt string for the LLM
+        Static part of the prompt, instructions and command documentation
         """
         return self.prompt_template.format(
-            flight_commands=", ".join(self.command_list),
-            command_documentation=json.dumps(self.command_documentation, indent=2)
+            command_documentation=self.command_documentation
+        )
+
+    def to_input(self) -> str:
+        """
+        Dynamic part of the prompt, the user input
+        """
+        return self.input_template.format(
+            flight_commands=", ".join(self.command_list)
         )
+
+    def to_prompt(self) -> str:
+        """
+        Convert the input to a prompt string for the LLM
+        """
+        return self.to_prefix() + self.to_input()
     
 class ImmediateCommand(BaseModel):
     """
@@ -233,6 +323,14 @@ class ImmediateCommand(BaseModel):
         """
     )
 
+class ConditionTerm(BaseModel):
+    """
+    One comparison of a vehicle telemetry field to a value, e.g. rel_alt > 10
+    """
+    field: Literal["lat", "lon", "rel_alt", "abs_alt", "x", "y", "z", "groundspeed"]
+    op: Literal[">", ">=", "<", "<="]
+    value: float
+
 class ConditionalCommand(BaseModel):
     """
     Represents a conditional command to be executed based on vehicle state
@@ -244,6 +342,28 @@ class ConditionalCommand(BaseModel):
         e.g. "When the vehicle is in LOITER mode, set the altitude to 10 meters"
         """
     )
+    predicate: Optional[List[ConditionTerm]] = Field(
+        None,
+        description= """
+        The condition as telemetry comparisons that must all be true, if it only depends on
+        numeric telemetry, e.g. [{"field": "rel_alt", "op": ">", "value": 10}]. Otherwise null
+        """
+    )
+
+def compile_predicate(terms: List[ConditionTerm]):
+    """
+    Compile predicate terms once into a plain function of the telemetry values, e.g.
+    def _pred(lat, lon, rel_alt, abs_alt, x, y, z, groundspeed): return rel_alt > 10.0
+    Fields and ops are Literal checked and values are floats, so the source is safe to exec.
+    Raises ValueError for inf or nan values, which repr as undefined names
+    """
+    if not all(math.isfinite(term.value) for term in terms):
+        raise ValueError(f"Non-finite predicate value in {terms}")
+
+    body = " and ".join(f"{term.field} {term.op} {term.value!r}" for term in terms) or "True"
+    namespace = {}
+    exec(f"def _pred({', '.join(TelemetryBuffer.FIELDS)}): return {body}", namespace)
+    return namespace["_pred"]
 
 class ContinuousCommand(ImmediateCommand):
     """
@@ -270,106 +390,368 @@ class ContinuousCommand(ImmediateCommand):
 class ParseCommandsStep_Output(BaseModel):
     """
     Output template for the flight command parser step
-    Format each command according to its documentation
+    Classify the user input, then format each command according to its documentation
     and categorize them into immediate, conditional, and continuous commands.
     """
+    response_type: Literal["simple_response", "flight_command"]
+    simple_response: Optional[str] = Field(
+        None, description="Simple response to the user input if applicable"
+    )
     immediate_commands: List[ImmediateCommand] 
     conditional_commands: List[ConditionalCommand]
     continuous_commands: List[ContinuousCommand]
 
-# ---- Main Loop ----
-while True:
+def text_format_param(model: type[BaseModel]) -> dict:
+    """
+    Strict JSON schema text config for a response model, the same one the SDK builds from text_format,
+    taken from the public pydantic_function_tool helper.
+    Built once here instead of regenerating the schema on every call
+    """
+    return {"format": {
+        "type": "json_schema",
+        "name": model.__name__,
+        "schema": openai.pydantic_function_tool(model)["function"]["parameters"],
+        "strict": True,
+    }}
 
-    vehicle_status = get_vehicle_status(vehicle)
-    # Get user input
-    user_input = input("\nUser: ").strip()
-    if user_input.lower() == "exit":
-        break
-    
-    new_input = ParseUserInputStep_Input(
-        user_input=user_input
-    ).to_prompt()
+STEP1_TEXT_FORMAT = text_format_param(ParseUserInputStep_Output)
+STEPS_1_2_TEXT_FORMAT = text_format_param(ParseCommandsStep_Output)
 
+# Step inputs are reused every turn with only the user input replaced, model_construct skips validation
+STEP1_INPUT = ParseUserInputStep_Input.model_construct(user_input="")
+STEPS_1_2_INPUT = ParseCommandsStep_Input.model_construct(command_list=[])
 
-    MESSAGES.append(
-        {"role": "user", "content": new_input}
+class ConditionCheck(BaseModel):
+    """
+    Result of checking a conditional command's condition against the vehicle status
+    """
+    condition_met: bool
+    reason: str = Field(
+        ..., description="Short reason the condition is or is not met"
     )
 
-    llm_speed = {
-        "start_time": time.time(),
-        "step1": 0.0,
-        "step2": 0.0,
-        "step3": 0.0,
-        "total_time": 0.0,
-    }
+CONDITION_CHECK_TEXT_FORMAT = text_format_param(ConditionCheck)
 
-    response = client.responses.parse(
-        model="gpt-4.1-nano",
-        input=[
-            MESSAGES[0],
-            MESSAGES[-1]
-        ],
-        text_format=ParseUserInputStep_Output,
-        temperature=0.0,
-    )
-        
-    parsed_response = ParseUserInputStep_Output.model_validate(response.output_parsed)
-    MESSAGES.append(
-        {"role": "assistant", "content": parsed_response.model_dump_json(indent=2)}
-    )
+class ConditionalEvaluator:
+    """
+    Buffers condition checks for conditional commands and sends them through
+    the OpenAI Batch API, at about half the cost of interactive calls.
+    Condition re-checks aren't latency critical, so only steps 1 and 2 call the LLM directly.
+    Buffered checks are submitted once max_items are queued or the oldest is max_wait seconds old.
+    A condition is re-checked against fresh vehicle status until a check finds it met.
+    """
+    prompt_template = """
+    You are a copilot for drone operations.
+    Decide if the condition below is met, given the current vehicle status.
 
+    Vehicle status:
+    {vehicle_status}
 
-    # -- Step 1: Classify user input
-    print("\n--- Step 1 ---")
-    print("Received response from LLM:")
-    print(parsed_response.model_dump_json(indent=2))
-    print("    --> LLM Response Type:", parsed_response.response_type)
+    Condition:
+    {condition}
+    """
 
-    if parsed_response.response_type == "simple_response":
-        # If the response is a simple response, print it
-        print("\n        --> LLM (simple response):", parsed_response.simple_response)
-        print("    Step 1 complete. No flight commands to parse.")
-        print("\n--- End Step 1 ---")
+    def __init__(self, client, model="gpt-4.1-nano", max_items=20, max_wait=5.0):
+        self.client = client
+        self.model = model
+        self.max_items = max_items
+        self.max_wait = max_wait
+        self.pending = []
+        self.first_pending_time = None
+        self.conditions = {}  # custom_id -> condition, for checks buffered or in a submitted batch
+        self.batch_ids = {}  # batch id -> custom_ids in it
+        self.watching = []  # Conditions not yet found met
+        self.count = 0
+        self.predicates = []
+
+    def add_predicate(self, condition: str, terms: List[ConditionTerm]):
+        """
+        Check a condition locally against the telemetry instead of with the LLM
+        """
+        self.predicates.append((condition, compile_predicate(terms)))
+
+    def check_predicates(self, values) -> List[str]:
+        """
+        Conditions met by the telemetry values, which are then no longer checked
+        """
+        met, pending = [], []
+        for condition, pred in self.predicates:
+            if pred(*values):
+                met.append(condition)
+            else:
+                pending.append((condition, pred))
 
-        llm_speed["total_time"] = time.time() - llm_speed["start_time"]
-        print("\nLoop time (1 step):", llm_speed)
-        continue
+        self.predicates = pending
+        return met
 
-    elif parsed_response.response_type == "flight_command":
-        print("\n        --> LLM (flight commands):", parsed_response.flight_commands)
-        print("    Step 1 complete. Proceeding to step 2 to parse flight commands ---")
-        print("\n--- End Step 1 ---")
+    def add(self, condition: str, vehicle_status: VehicleStatus):
+        """
+        Watch a condition, buffering its first check against the given vehicle status
+        """
+        self.watching.append(condition)
+        self.check(condition, vehicle_status)
 
+    def recheck(self, vehicle_status: VehicleStatus):
+        """
+        Buffer a new check for each watched condition that has none buffered or in flight
+        """
+        checking = set(self.conditions.values())
+        for condition in self.watching:
+            if condition not in checking:
+                self.check(condition, vehicle_status)
+                checking.add(condition)
 
-    # -- Step 2: Parse the flight commands
-    print("\n--- Step 2 ---")
-    command_input = ParseCommandsStep_Input(
-        command_list=parsed_response.flight_commands,
-        command_documentation=CmdDocumentation
-    ).to_prompt()
+    def check(self, condition: str, vehicle_status: VehicleStatus):
+        """
+        Buffer a condition check against the given vehicle status
+        """
+        self.count += 1
+        custom_id = f"condition-{self.count}"
+        self.conditions[custom_id] = condition
+
+        self.pending.append({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/responses",
+            "body": {
+                "model": self.model,
+                "input": self.prompt_template.format(
+                    vehicle_status=vehicle_status, condition=condition
+                ),
+                "text": CONDITION_CHECK_TEXT_FORMAT,
+                "temperature": 0.0,
+            }
+        })
+        if self.first_pending_time is None:
+            self.first_pending_time = time.perf_counter()
+
+    def due(self) -> bool:
+        """
+        True if the buffered checks should be submitted
+        """
+        return bool(self.pending) and (
+            len(self.pending) >= self.max_items
+            or time.perf_counter() - self.first_pending_time >= self.max_wait
+        )
 
-    MESSAGES.append(
-        {"role": "user", "content": command_input}
-    )
+    async def flush(self) -> Optional[str]:
+        """
+        Submit the buffered checks as one batch, returns the batch id
+        """
+        if not self.pending:
+            return None
+
+        pending = self.pending
+        batch_input = b"\n".join(to_json(request) for request in pending)
+        self.pending = []
+        self.first_pending_time = None
+
+        try:
+            batch_file = await self.client.files.create(
+                file=("conditions.jsonl", batch_input), purpose="batch"
+            )
+            batch = await self.client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint="/v1/responses",
+                completion_window="24h",
+            )
+        except Exception:
+            # Not submitted, so recheck buffers these conditions again
+            for request in pending:
+                self.conditions.pop(request["custom_id"], None)
+            raise
+        self.batch_ids[batch.id] = [request["custom_id"] for request in pending]
+        return batch.id
+
+    async def collect(self) -> List[tuple[str, ConditionCheck]]:
+        """
+        Poll the submitted batches, returns (condition, check) for each finished batch's results.
+        Conditions found met stop being watched, the rest are checked again by recheck.
+        """
+        results = []
+        for batch_id, custom_ids in list(self.batch_ids.items()):
+            batch = await self.client.batches.retrieve(batch_id)
+            if batch.status in ("validating", "in_progress", "finalizing"):
+                continue
+
+            # Finished one way or another, its conditions are free for recheck
+            del self.batch_ids[batch_id]
+            conditions = {custom_id: self.conditions.pop(custom_id, None) for custom_id in custom_ids}
+            if batch.status != "completed" or not batch.output_file_id:
+                print(f"    Condition batch {batch_id} ended with status: {batch.status}")
+                continue
+
+            output = await self.client.files.content(batch.output_file_id)
+            for line in output.content.splitlines():
+                result = from_json(line)
+                condition = conditions.get(result["custom_id"])
+                if condition is None or not result.get("response") or result["response"]["status_code"] != 200:
+                    continue
+
+                text = next((
+                    content["text"]
+                    for item in result["response"]["body"]["output"] if item["type"] == "message"
+                    for content in item["content"] if content["type"] == "output_text"
+                ), None)
+                if text is None:
+                    # ie a refusal, which has no output_text item
+                    print(f"    No text output for condition check: {condition}")
+                    continue
+                check = ConditionCheck.model_validate_json(text)
+                if check.condition_met and condition in self.watching:
+                    self.watching.remove(condition)
+                results.append((condition, check))
+
+        return results
+
+conditional_evaluator = ConditionalEvaluator(client)
+
+# Continuous commands run by the scheduler, as (command, compiled end condition or None)
+continuous_tasks = []
 
-    response = client.responses.parse(
-        model="gpt-4.1-mini",
-        input=[
-            MESSAGES[0],
-            MESSAGES[-1],
-        ],
-        text_format=ParseCommandsStep_Output,
-        temperature=0.0,
+# ---- Main Loop ----
+async def classify_input(user_input: str) -> ParseUserInputStep_Output:
+    """
+    Step 1 on its own, classify the user input as a simple response or flight commands
+    """
+    STEP1_INPUT.user_input = user_input
+    new_input = STEP1_INPUT.to_prompt()
+
+    user_message = {"role": "user", "content": new_input}
+
+    async with LLM_LIMIT:
+        response = await client.responses.create(
+            model="gpt-4.1-nano",
+            instructions=SYSTEM_PROMPT,
+            input=[
+                user_message
+            ],
+            text=STEP1_TEXT_FORMAT,
+            temperature=0.0,
+        )
+        
+    return ParseUserInputStep_Output.model_validate_json(response.output_text)
+
+
+def completed_immediate_commands(partial_text: str) -> list:
+    """
+    Immediate commands fully received so far in a streamed ParseCommandsStep_Output JSON response.
+    Partial parsing keeps an incomplete trailing object, so the last one is held back
+    """
+    if not partial_text.strip():
+        return []
+    return from_json(partial_text, allow_partial=True).get("immediate_commands", [])[:-1]
+
+
+async def create_prefix_response() -> Optional[str]:
+    """
+    Send the system prompt, steps 1-2 instructions and command docs once, stored server side.
+    Steps 1-2 calls chain to it with previous_response_id, so only the user input is sent
+    and the server reuses the same prefix every time. Returns the response id, or None on failure
+    """
+    try:
+        response = await client.responses.create(
+            model="gpt-4.1-mini",
+            instructions=SYSTEM_PROMPT,
+            input=[
+                {"role": "user", "content": STEPS_1_2_INPUT.to_prefix()},
+            ],
+            store=True,
+            max_output_tokens=16,
+            temperature=0.0,
+        )
+        return response.id
+
+    except openai.APIError as e:
+        print(f"Prefix response not stored ({e.__class__.__name__}), sending the full prompt each call")
+        return None
+
+
+async def parse_input(user_input: str, prefix_response_id: Optional[str] = None) -> ParseCommandsStep_Output:
+    """
+    Steps 1 and 2 in one call, classify the user input and parse any flight commands.
+    Falls back to step 1 alone on nano if the mini call fails, ie when mini is rate limited
+    """
+    # Prompts are built before any await, so batched calls can share the one input instance
+    STEPS_1_2_INPUT.command_list = [user_input]
+
+    # Every call chains to the same prefix response rather than the last turn, so context doesn't grow
+    if prefix_response_id:
+        prompt_args = {
+            "input": [{"role": "user", "content": STEPS_1_2_INPUT.to_input()}],
+            "previous_response_id": prefix_response_id,
+        }
+    else:
+        prompt_args = {
+            "input": [{"role": "user", "content": STEPS_1_2_INPUT.to_prompt()}],
+        }
+
+    text = ""
+    shown = 0
+
+    try:
+        async with LLM_LIMIT:
+            async with client.responses.stream(
+                model="gpt-4.1-mini",
+                instructions=SYSTEM_PROMPT,
+                **prompt_args,
+                text=STEPS_1_2_TEXT_FORMAT,
+                temperature=0.0,
+            ) as stream:
+                async for event in stream:
+                    if event.type != "response.output_text.delta":
+                        continue
+                    text += event.delta
+
+                    # Show each immediate command as soon as it's complete, while the rest generate
+                    received = completed_immediate_commands(text)
+                    for cmd in received[shown:]:
+                        print("    --> Immediate command received:", cmd.get("cmd"))
+                    shown = len(received)
+
+                await stream.get_final_response()
+
+        return ParseCommandsStep_Output.model_validate_json(text)
+
+    except openai.APIError as e:
+        print(f"\n    Steps 1-2 call failed ({e.__class__.__name__}), falling back to step 1 on nano")
+
+    # Without step 2 no commands are parsed, so flight commands are only reported back
+    parsed_response = await classify_input(user_input)
+    return ParseCommandsStep_Output(
+        response_type="simple_response",
+        simple_response=parsed_response.simple_response or
+            f"Unable to parse flight commands right now: {parsed_response.flight_commands}",
+        immediate_commands=[],
+        conditional_commands=[],
+        continuous_commands=[],
     )
 
-    parsed_commands = ParseCommandsStep_Output.model_validate(response.output_parsed)
-    print("\n        --> LLM Parsed Commands:", parsed_commands.model_dump_json(indent=2))
-    
 
-    print("\n--- Step 2 complete ---")
+async def handle(parsed_commands: ParseCommandsStep_Output, llm_speed: dict):
+    """
+    Report the parsed user input and process any flight commands
+    """
+
+    # -- Steps 1-2: Classify user input and parse the flight commands
+    print("\n--- Steps 1-2 ---")
+    print("\n        --> LLM Parsed Commands:", parsed_commands.model_dump_json())
+    print("    --> LLM Response Type:", parsed_commands.response_type)
+
+    if parsed_commands.response_type == "simple_response":
+        # If the response is a simple response, print it
+        print("\n        --> LLM (simple response):", parsed_commands.simple_response)
+        print("    No flight commands to process.")
+        print("\n--- End Steps 1-2 ---")
+
+        llm_speed["total_time"] = time.perf_counter() - llm_speed["start_time"]
+        print("\nLoop time (1 call):", llm_speed)
+        return
+
+    print("\n--- Steps 1-2 complete ---")
 
-    total_time = time.time() - llm_speed["start_time"]
-    print("\nLoop time (2 steps):", total_time)
+    total_time = time.perf_counter() - llm_speed["start_time"]
+    print("\nLoop time (1 call):", total_time)
 
     # -- Step 3: Process the parsed commands
     print("\n--- Step 3 (in work) ---")
@@ -378,8 +760,7 @@ while True:
     if parsed_commands.immediate_commands:
         print("\nExecuting immediate commands:")
 
-        while parsed_commands.immediate_commands:
-            cmd = parsed_commands.immediate_commands.pop(0)
+        for cmd in parsed_commands.immediate_commands:
             print("    Executing command:", cmd.cmd)
 
     if parsed_commands.conditional_commands:
@@ -387,6 +768,13 @@ while True:
 
         for cmd in parsed_commands.conditional_commands:
             print("    Condition:", cmd.condition)
+            if cmd.predicate:
+                try:
+                    conditional_evaluator.add_predicate(cmd.condition, cmd.predicate)
+                    continue
+                except ValueError as e:
+                    print(f"    Predicate not usable ({e}), checking with the LLM instead")
+            conditional_evaluator.add(cmd.condition, get_vehicle_status(telemetry))
 
     if parsed_commands.continuous_commands:
         print("\nContinuous commands to be executed until stopped:")
@@ -399,6 +787,99 @@ while True:
             if cmd.end_condition:
                 print("    End condition:", cmd.end_condition.condition)
 
+            end_predicate = None
+            if cmd.end_condition and cmd.end_condition.predicate:
+                try:
+                    end_predicate = compile_predicate(cmd.end_condition.predicate)
+                except ValueError as e:
+                    print(f"    End condition predicate not usable ({e}), running until stopped")
+            continuous_tasks.append((cmd, end_predicate))
+
 
     print("\nEnd of commands.")
     print("\n--- End Step 3 ---\n")
+
+
+async def scheduler(interval: float = 1.0, collect_every: int = 30):
+    """
+    One loop ticking at 1 Hz for all continuous commands and conditional checks,
+    instead of a thread per command
+    """
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
+    tick = 0
+
+    while True:
+        next_tick += interval
+        await asyncio.sleep(max(0.0, next_tick - loop.time()))
+        tick += 1
+
+        try:
+            with telemetry.lock:
+                values = tuple(telemetry.values)
+
+            for condition in conditional_evaluator.check_predicates(values):
+                print(f"\nCondition met: {condition}")
+
+            # Continuous commands are issued here each tick once execution is implemented,
+            # those with a numeric end condition stop when it's met
+            for task in list(continuous_tasks):
+                cmd, end_predicate = task
+                if end_predicate and end_predicate(*values):
+                    continuous_tasks.remove(task)
+                    print(f"\nContinuous command ended: {cmd.cmd}")
+
+            if conditional_evaluator.due():
+                await conditional_evaluator.flush()
+
+            # Batches take minutes or more to complete, so results are polled less often
+            if tick % collect_every == 0:
+                for condition, check in await conditional_evaluator.collect():
+                    print(f"\nCondition check: {condition}\n    --> met: {check.condition_met} ({check.reason})")
+
+                # Conditions not met yet are checked again against the current status
+                conditional_evaluator.recheck(get_vehicle_status(telemetry))
+
+        except openai.APIError as e:
+            print(f"\nCondition batch request failed ({e.__class__.__name__}), retrying next tick")
+        except Exception as e:
+            # ie a malformed batch result, one bad tick mustn't end the scheduler task
+            print(f"\nScheduler tick failed ({e.__class__.__name__}: {e}), continuing next tick")
+
+
+async def main():
+    prefix_response_id = await create_prefix_response()
+    scheduler_task = asyncio.create_task(scheduler())
+
+    while True:
+
+        vehicle_status = get_vehicle_status(telemetry)
+        # Get user input
+        user_input = (await asyncio.to_thread(input, "\nUser: ")).strip()
+        if user_input.lower() == "exit":
+            break
+
+        # Several inputs can be sent at once, ie "batch: arm; takeoff to 20m; what is RTL?"
+        # They're parsed concurrently, then each is handled in order
+        if user_input.lower().startswith("batch:"):
+            user_inputs = [u.strip() for u in user_input[6:].split(";") if u.strip()]
+        else:
+            user_inputs = [user_input]
+
+        llm_speed = {
+            "start_time": time.perf_counter(),
+            "step1": 0.0,
+            "step2": 0.0,
+            "step3": 0.0,
+            "total_time": 0.0,
+        }
+
+        parsed_inputs = await asyncio.gather(*[parse_input(u, prefix_response_id) for u in user_inputs])
+
+        for parsed_commands in parsed_inputs:
+            await handle(parsed_commands, llm_speed)
+
+    scheduler_task.cancel()
+
+
+asyncio.run(main())
@@ -5,15 +5,23 @@ by IGSXF
 """
 
 import os
+import re
 import json
 import time
-import threading
+import asyncio
+import hashlib
+import email.utils
+import functools
+import string
 import openai
-import queue
+import tiktoken
 import math
 from pathlib import Path
-from typing_extensions import List, Literal, TypedDict, Union, Optional
-from pydantic import BaseModel, Field
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing_extensions import Callable, List, Literal, TypedDict, Union, Optional
+from pydantic import BaseModel, Field, TypeAdapter
+from pydantic_core import from_json
 from dronekit import VehicleMode, LocationGlobalRelative, connect
 
 
@@ -79,83 +87,6 @@ class InputClassifier(BaseModel):
         description="Reason for the decision made, in minimal words, to provide context in later steps. Skip is self-explanatory."
     )
 
-def new_input_step(input_content: str,
-                   messages: List[dict],
-                   input_timestamp: float,
-                   input_source: Literal["user", "script"],
-                   messages_limit=5,
-                   context: Optional[str] = None,
-                   vehicle_state: Optional[dict] = None,
-                   model: str = "gpt-4.1-nano") -> InputClassifier:
-    """
-    Classify the input content and source to determine the appropriate response type.
-
-    Since this step emphasizes speed and efficiency, and punts the actual thinking to the
-    next step if necessary, it can reduce the number of messages processed
-    to a fixed limit (e.g., developer plus latest 5) to ensure quick response times.
-
-    Args:
-        input_content (str): The content of the input to classify.
-        input_source (Literal["user", "script"]): The source of the input.
-        messages (List[dict]): The list of messages to consider for classification.
-        input_timestamp (float): The timestamp of the input.
-        messages_limit (int): The maximum number of messages to consider for classification.
-        model (str): The LLM model to use for classification.
-
-    Returns:
-        InputClassifier: An instance of InputClassifier with the classification result.
-    """
-    # Maintain the developer message at the start of the messages list
-    developer_message = messages[0]
-    original_messages = messages[1:]  # Exclude the developer message
-
-    if len(original_messages) > messages_limit:
-        used_messages = [developer_message] + original_messages[-messages_limit:]
-    else:
-        used_messages = [developer_message] + original_messages
-
-
-    input_header = f"Time(UTC): {round(input_timestamp)} | Input source: {input_source.upper()}:\n"
-
-    if vehicle_state:
-        vehicle_info = f"Vehicle state: {json.dumps(vehicle_state, indent=2)}\n"
-
-    input_body = "\n".join([
-        f"New input:\n{input_content.strip()}",
-        f"Situation context: {context or 'N/A'}",
-        f"Vehicle info: {vehicle_info if vehicle_state else 'N/A'}"
-    ])
-
-    used_messages.append({"role": 'user', "content": input_header + input_body})
-
-    print(used_messages[-1]["content"])
-
-    # print("Messages used in New InputStep:\n", json.dumps(used_messages, indent=2))
-
-    start_time = time.time()
-
-    result = client.responses.parse(
-        model=model,
-        input=used_messages,
-        temperature=0.0,
-        top_p=0.1,
-        text_format=InputClassifier,
-    )
-
-    response_header = f"{round(time.time())} | New Input Step Response:\n"
-    response_content = response_header + result.output_parsed.model_dump_json(indent=2)
-
-    messages.append({"role": "user", "content": input_header + input_body})
-    messages.append({"role": "assistant", "content": response_content})
-
-    elapsed = time.time() - start_time
-
-    token_count = result.usage.total_tokens
-
-    return result.output_parsed, messages, elapsed, token_count
-
-
-
 # Command Components
 command_guidance = """
 With the given task, select a command from the predefined set that is best suited to accomplish the task.
@@ -301,43 +232,448 @@ class ConditionalEvalOutput(BaseModel):
         description="List of commands that have been evaluated based on the current vehicle state and context."
     )
 
-def handle_tasks_step(tasks: list = [],
-                      command_guidance: str = command_guidance,
-                      model: str = 'gpt-4.1-nano',
-                      vehicle_state: dict = None,
-                      context: str = None) -> CommandHandler:
+class CombinedDecision(InputClassifier):
+    __doc__ = InputClassifier.__doc__ + """
+    cmds:
+    If 'decision' is 'operational_response', also handle the tasks in this same response:
+    match each task to a predefined Command following the command guidance, or reject it.
+    Otherwise leave cmds empty.
+    """
+
+    cmds: List[Command] = Field(
+        default_factory=list,
+        description="List of commands to be executed for the tasks, if operational_response"
+    )
+
+def text_format_param(model: type[BaseModel]) -> dict:
+    """
+    Strict JSON schema text config for a response model, the same schema responses.parse builds
+    from text_format, taken from the public pydantic_function_tool helper.
+    """
+    return {"format": {
+        "type": "json_schema",
+        "name": model.__name__,
+        "schema": openai.pydantic_function_tool(model)["function"]["parameters"],
+        "strict": True,
+    }}
+
+# Built once for the streamed input step, which can't pass text_format
+COMBINED_DECISION_TEXT_FORMAT = text_format_param(CombinedDecision)
+
+# Tokenizer for local token counts before sending, the gpt-4.1 models use o200k_base
+ENCODING = tiktoken.get_encoding("o200k_base")
+
+def message_tokens(message: dict) -> int:
+    """
+    Tokens for one message, its content plus 3 tokens of message overhead.
+    Special token text such as "<|endoftext|>" in an input is counted as plain text instead of raising.
+    """
+    return 3 + len(ENCODING.encode(message["content"] or "", disallowed_special=()))
+
+def num_tokens_from_messages(messages: List[dict]) -> int:
+    """
+    Input tokens for a list of messages, per the OpenAI cookbook count, plus 3 to prime the reply.
+    """
+    return 3 + sum(message_tokens(message) for message in messages)
+
+def parse_reset(value: str) -> float:
+    """
+    Seconds from an x-ratelimit-reset-* header value, e.g. "1s", "6m0s" or "20ms".
+    """
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    return sum(float(amount) * units[unit] for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value))
+
+def parse_retry_after(value: Optional[str], attempt: int) -> float:
+    """
+    Seconds to wait from a retry-after header, given in seconds or as an HTTP date.
+    Falls back to exponential backoff when it is missing or unreadable.
+    """
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    return float(2 ** attempt)
+
+class RateLimitedClient:
+    """
+    Wraps client.responses calls to stay under the OpenAI request and token rate limits.
+
+    Each response's x-ratelimit-remaining-* headers update the known headroom, and calls wait
+    for the reset before going out when the next one wouldn't fit, instead of spending a round
+    trip on a 429. A 429 that still happens waits exactly its retry-after before retrying.
+    Timeouts, dropped connections, 408/409s and 5xxs are retried with exponential backoff.
+    """
+    def __init__(self, client: openai.AsyncOpenAI, max_concurrent: int = 4, max_retries: int = 3):
+        # The SDK's own retries would resend 429s without the headroom checks, so this class does the retrying
+        self.client = client.with_options(max_retries=0)
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.max_retries = max_retries
+        self.remaining_requests = None  # Unknown until the first response
+        self.remaining_tokens = None
+        self.reset_requests = 0.0  # Seconds until each limit resets, as of the last response
+        self.reset_tokens = 0.0
+        self.resume_time = 0.0  # Earliest time.time() the next call may go out
+
+    def update(self, headers) -> None:
+        """ Update the headroom from a response's rate limit headers. """
+        now = time.time()
+        if "x-ratelimit-remaining-requests" in headers:
+            self.remaining_requests = int(headers["x-ratelimit-remaining-requests"])
+            self.reset_requests = parse_reset(headers.get("x-ratelimit-reset-requests", "0s"))
+        if "x-ratelimit-remaining-tokens" in headers:
+            self.remaining_tokens = int(headers["x-ratelimit-remaining-tokens"])
+            self.reset_tokens = parse_reset(headers.get("x-ratelimit-reset-tokens", "0s"))
+        if self.remaining_requests is not None and self.remaining_requests <= 0:
+            self.resume_time = max(self.resume_time, now + self.reset_requests)
+
+    async def acquire(self, expected_tokens: int) -> None:
+        """ Wait until there is headroom for one request of expected_tokens. """
+        if self.remaining_tokens is not None and expected_tokens > self.remaining_tokens:
+            self.resume_time = max(self.resume_time, time.time() + self.reset_tokens)
+
+        delay = self.resume_time - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+            # Limits have reset, headroom is unknown again until the next response
+            self.remaining_requests = None
+            self.remaining_tokens = None
+        elif self.remaining_requests is not None:
+            self.remaining_requests -= 1
+        if self.remaining_tokens is not None:
+            self.remaining_tokens -= expected_tokens
+
+    async def raw_call(self, expected_tokens: int, method, **kwargs):
+        """
+        Call a with_raw_response method once there is headroom, retrying 429s after retry-after
+        and transient errors after a backoff. Callers hold the semaphore.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(expected_tokens)
+            try:
+                raw = await method(**kwargs)
+            except openai.RateLimitError as e:
+                if attempt == self.max_retries:
+                    raise
+                # Holds back every call, the limit is shared
+                retry_after = parse_retry_after(e.response.headers.get("retry-after"), attempt)
+                self.resume_time = max(self.resume_time, time.time() + retry_after)
+                continue
+            except (openai.APIConnectionError, openai.APIStatusError) as e:
+                # The ones the SDK would have retried, APITimeoutError is an APIConnectionError
+                response = getattr(e, "response", None)
+                transient = response is None or response.status_code in (408, 409) or response.status_code >= 500
+                if not transient or attempt == self.max_retries:
+                    raise
+                retry_after = response.headers.get("retry-after") if response is not None else None
+                await asyncio.sleep(parse_retry_after(retry_after, attempt))
+                continue
+            self.update(raw.headers)
+            return raw
+
+    async def parse(self, expected_tokens: int = 0, **kwargs):
+        """
+        client.responses.parse, gated on the rate limit headroom.
+
+        Args:
+            expected_tokens (int): Input tokens for the call, counted locally with tiktoken.
+            Remaining args are passed to client.responses.parse.
+        """
+        async with self.semaphore:
+            raw = await self.raw_call(expected_tokens, self.client.responses.with_raw_response.parse, **kwargs)
+            return raw.parse()
+
+    async def stream(self, expected_tokens: int = 0, on_text=None, **kwargs) -> tuple[str, Optional[object], str]:
+        """
+        Streamed client.responses.create, gated the same way as parse.
+
+        Args:
+            expected_tokens (int): Input tokens for the call, counted locally with tiktoken.
+            on_text (Callable[[str], bool]): Called with the output text so far after each delta,
+                returning True closes the stream early.
+            Remaining args are passed to client.responses.create.
+
+        Returns:
+            tuple[str, Optional[ResponseUsage], str]: The output text, the usage or None if closed early,
+                and how the stream ended: "completed", "closed" early, "incomplete", "refused" or "failed".
+        """
+        async with self.semaphore:
+            raw = await self.raw_call(expected_tokens, self.client.responses.with_raw_response.create,
+                                      stream=True, **kwargs)
+            events = raw.parse()
+
+            text = ""
+            usage = None
+            status = "incomplete"  # Unless a terminal event says otherwise
+            refused = False
+            async for event in events:
+                if event.type == "response.output_text.delta":
+                    text += event.delta
+                    if on_text and on_text(text):
+                        await events.close()
+                        status = "closed"
+                        break
+                elif event.type == "response.refusal.delta":
+                    refused = True
+                elif event.type in ("response.completed", "response.incomplete"):
+                    usage = event.response.usage
+                    status = "completed" if event.type == "response.completed" else "incomplete"
+                elif event.type in ("response.failed", "error"):
+                    status = "failed"
+
+            if refused:
+                status = "refused"
+
+            return text, usage, status
+
+# Sent after the developer message in the input step, so tasks are handled in the same call
+COMMAND_GUIDANCE_MESSAGE = {
+    "role": "developer",
+    "content": "For operational responses, handle the tasks as commands:\n" + command_guidance
+}
+
+async def new_input_step(input_content: str,
+                         messages: List[dict],
+                         input_timestamp: float,
+                         input_source: Literal["user", "script", "batch"],
+                         messages_limit=5,
+                         context: Optional[str] = None,
+                         vehicle_state: Optional[dict] = None,
+                         model: str = "gpt-4.1-nano",
+                         text_format: type[BaseModel] = CombinedDecision,
+                         max_input_tokens: int = 8000,
+                         on_command: Optional[Callable[[Command], None]] = None) -> CombinedDecision:
+    """
+    Classify the input content and source to determine the appropriate response type,
+    and for operational responses also handle the tasks as commands, in the same LLM call.
+
+    Since this step emphasizes speed and efficiency, and punts the actual thinking to the
+    next step if necessary, it can reduce the number of messages processed
+    to a fixed limit (e.g., developer plus latest 5) to ensure quick response times.
+    The history is also trimmed, oldest first, to fit max_input_tokens, so one long message
+    can't overflow the context window.
+
+    With on_command, the response is streamed and each command is passed to on_command as soon
+    as it is complete, so immediate commands can run while the rest generate. A 'no response'
+    decision closes the stream as soon as it arrives, since nothing after it is used.
+
+    Args:
+        input_content (str): The content of the input to classify.
+        input_source (Literal["user", "script", "batch"]): The source of the input.
+        messages (List[dict]): The list of messages to consider for classification.
+        input_timestamp (float): The timestamp of the input.
+        messages_limit (int): The maximum number of messages to consider for classification.
+        model (str): The LLM model to use for classification.
+        text_format (type[BaseModel]): The response schema, BatchClassifier for batched inputs.
+        max_input_tokens (int): Input token budget, counted locally with tiktoken.
+        on_command (Callable[[Command], None]): Called with each command as it streams in, CombinedDecision only.
+
+    Returns:
+        CombinedDecision: An instance of CombinedDecision with the classification result and commands.
+    """
+    # Maintain the developer message at the start of the messages list
+    developer_message = messages[0]
+    original_messages = messages[1:]  # Exclude the developer message
+
+    input_header = f"Time(UTC): {round(input_timestamp)} | Input source: {input_source.upper()}:\n"
+
+    if vehicle_state:
+        vehicle_info = f"Vehicle state: {repr_vehicle_state(vehicle_state)}\n"
+
+    input_body = "\n".join([
+        f"New input:\n{input_content.strip()}",
+        f"Situation context: {context or 'N/A'}",
+        f"Vehicle info: {vehicle_info if vehicle_state else 'N/A'}"
+    ])
+
+    new_message = {"role": 'user', "content": input_header + input_body}
+    fixed_messages = [developer_message, COMMAND_GUIDANCE_MESSAGE]
+
+    # Keep the newest history messages that fit in the token budget
+    budget = max_input_tokens - num_tokens_from_messages(fixed_messages + [new_message])
+    history = []
+    for message in reversed(original_messages[-messages_limit:]):
+        budget -= message_tokens(message)
+        if budget < 0:
+            break
+        history.insert(0, message)
+
+    used_messages = fixed_messages + history + [new_message]
+
+    print(used_messages[-1]["content"])
+
+    # print("Messages used in New InputStep:\n", json.dumps(used_messages, indent=2))
+
+    start_time = time.time()
+
+    if on_command:
+        if text_format is not CombinedDecision:
+            raise ValueError("on_command streams a CombinedDecision, it can't be used with another text_format")
+
+        received = 0
+
+        def on_text(text: str) -> bool:
+            nonlocal received
+            if not text.strip():
+                return False
+            partial = from_json(text, allow_partial=True)
+            # Same gate as handle_decision, decision and tasks are complete before cmds start streaming
+            if partial.get("decision") == "operational_response" and partial.get("tasks"):
+                # Partial parsing keeps an incomplete trailing command, so the last one is held back
+                commands = partial.get("cmds", [])[:-1]
+                for command in commands[received:]:
+                    on_command(command)
+                received = max(received, len(commands))
+            return partial.get("decision") == "no response"
+
+        text, usage, status = await rate_limited_client.stream(
+            num_tokens_from_messages(used_messages),
+            on_text,
+            model=model,
+            input=used_messages,
+            temperature=0.0,
+            top_p=0.1,
+            text=COMBINED_DECISION_TEXT_FORMAT,
+        )
+
+        if status == "completed":
+            output_parsed = text_format.model_validate_json(text)
+            # The last command is only complete once the whole response is
+            if output_parsed.decision == "operational_response" and output_parsed.tasks:
+                for command in output_parsed.cmds[received:]:
+                    on_command(command)
+        elif status == "closed":
+            # Closed as soon as the decision was 'no response', nothing after it is used
+            output_parsed = text_format(decision="no response")
+        else:
+            # Commands completed before the stream stopped have already been passed to on_command
+            output_parsed = text_format(
+                decision="simple_response",
+                response_content=f"Unable to handle the input, the response was {status}",
+                reason=f"Response {status}, {received} command(s) received",
+            )
+        token_count = usage.total_tokens if usage else None
+
+    else:
+        result = await rate_limited_client.parse(
+            num_tokens_from_messages(used_messages),
+            model=model,
+            input=used_messages,
+            temperature=0.0,
+            top_p=0.1,
+            text_format=text_format,
+        )
+        output_parsed = result.output_parsed
+        token_count = result.usage.total_tokens
+
+    response_header = f"{round(time.time())} | New Input Step Response:\n"
+    response_content = response_header + DECISION_ADAPTER.dump_json(output_parsed).decode()
+
+    # Only the raw input persists in the history, the header and vehicle state are re-rendered each call
+    messages.append({"role": "user", "content": input_content.strip()})
+    messages.append({"role": "assistant", "content": response_content})
+
+    elapsed = time.time() - start_time
+
+    return output_parsed, messages, elapsed, token_count
+
+
+class BatchClassifier(BaseModel):
+    """
+    Decisions for a batch of numbered inputs, one CombinedDecision per input in the same order.
+    """
+    items: List[CombinedDecision]
+
+# Serializes either decision type in one compiled call, for the history and the printed output
+DECISION_ADAPTER = TypeAdapter(Union[CombinedDecision, BatchClassifier])
+
+async def new_batch_input_step(inputs: List[tuple[str, str]],
+                               messages: List[dict],
+                               input_timestamp: float,
+                               **kwargs) -> BatchClassifier:
     """
+    new_input_step for several queued inputs in one LLM call, instead of a round trip each.
 
+    Args:
+        inputs (List[tuple[str, str]]): (input_content, input_source) for each input, in order.
+        Remaining args are passed to new_input_step.
+
+    Returns:
+        BatchClassifier: An instance of BatchClassifier with a decision per input.
     """
+    numbered_inputs = "\n".join(
+        f"{i}. [{input_source.upper()}] {input_content.strip()}"
+        for i, (input_content, input_source) in enumerate(inputs, start=1)
+    )
+    input_content = (
+        f"Answer each of these {len(inputs)} numbered inputs separately and in order, "
+        f"with one item per input:\n{numbered_inputs}"
+    )
 
+    return await new_input_step(input_content, messages, input_timestamp, "batch",
+                                text_format=BatchClassifier, **kwargs)
 
-    input_content = """
+
+# Prompt templates for handle_tasks_step and conditional_eval_input, parsed once at import
+HANDLE_TASKS_INSTRUCTIONS = string.Template("""
     Handle the tasks generated from the InputClassifier step.
 
     Match the tasks to available set of predefined commands that the vehicle can execute
     using the following command set and guidelines, as well as the current vehicle state and situational context.
-    {command_guidance}
+    $command_guidance
 
-    Tasks:
-    {tasks}
+    Return a list of Command objects in the CommandHandler schema.
+    """)
 
-    Vehicle state:
-    {vehicle_state}
+HANDLE_TASKS_TEMPLATE = string.Template("""Tasks:
+$tasks
 
-    Situational context:
-    {context}
+Vehicle state:
+$vehicle_state
 
-    Return a list of Command objects in the CommandHandler schema.
-    """.format(
-        command_guidance=command_guidance,
-        tasks="\n".join([f"- {task}" for task in tasks]) if tasks else "No tasks to handle.",
-        vehicle_state=json.dumps(vehicle_state, indent=2) if vehicle_state else "N/A",
+Situational context:
+$context""")
+
+@functools.lru_cache(maxsize=4)
+def handle_tasks_instructions(command_guidance: str) -> str:
+    """
+    System message for handle_tasks_step, built once per command guidance.
+    """
+    return HANDLE_TASKS_INSTRUCTIONS.substitute(command_guidance=command_guidance)
+
+async def handle_tasks_step(tasks: list = [],
+                            command_guidance: str = command_guidance,
+                            model: str = 'gpt-4.1-nano',
+                            vehicle_state: dict = None,
+                            context: str = None) -> CommandHandler:
+    """
+    Match tasks to commands in a separate LLM call.
+    Inputs from the main loop get their commands from new_input_step instead,
+    this is kept for handling task batches outside of it.
+    """
+    # Static instructions and command guidance lead as the system message, byte-identical every call
+    # so OpenAI's prompt cache can reuse them. Only the user message changes
+    instructions = handle_tasks_instructions(command_guidance)
+
+    input_content = HANDLE_TASKS_TEMPLATE.substitute(
+        tasks="\n".join(f"- {task}" for task in tasks) if tasks else "No tasks to handle.",
+        vehicle_state=repr_vehicle_state(vehicle_state) if vehicle_state else "N/A",
         context=context or "N/A"
     )
 
-    result = client.responses.parse(
+    input_messages = [
+        {"role": "system", "content": instructions},
+        {"role": "user", "content": input_content}
+    ]
+
+    result = await rate_limited_client.parse(
+        num_tokens_from_messages(input_messages),
         model=model,
-        input=input_content,
+        input=input_messages,
         temperature=0.0,
         top_p=0.0,
         text_format=CommandHandler,
@@ -348,85 +684,122 @@ def handle_tasks_step(tasks: list = [],
 def repr_command(command: Command) -> str:
     """    Represent a command as a string for easy reading."""
     # Create dict of cmd k-v pairs
-    cmd_params = dict(list(zip(command['cmd_keys'], command['cmd_values'])))
+    cmd_params = dict(zip(command['cmd_keys'], command['cmd_values']))
 
     # Create header and body
-    header = f"Command: {command['cmd']} | Type: {command['cmd_type']}"
-    if command['cmd_type'] == 'immediate':
+    cmd_type = command['cmd_type']
+    header = f"Command: {command['cmd']} | Type: {cmd_type}"
+    if cmd_type == 'immediate':
         cmd_string = f"{header} | Params: {json.dumps(cmd_params)}"
-    elif command['cmd_type'] in ['conditional', 'continous']:
+    elif cmd_type in ['conditional', 'continous']:
         cmd_string = f"{header} | Params: {json.dumps(cmd_params)}\n\tExec condition: {command['exec_condition']} | Stop condition: {command.get('stop_condition', 'N/A')}"
 
     return cmd_string
 
-def run_command(command: Command, vehicle) -> None:
-    command_params = dict(list(zip(command['cmd_keys'], command['cmd_values'])))
-    c = {'cmd': command['cmd']} | command_params
-
-    if c['cmd'] == 'arm_disarm':
-        vehicle.armed = c['arm']
-        print(f"Vehicle {'armed' if c['arm'] else 'disarmed'}.")
-
-    elif c['cmd'] == 'set_mode':
-        vehicle.mode = VehicleMode(c['mode'])
-        print(f"Vehicle mode set to {c['mode']}.")
-
-    elif c['cmd'] == 'set_speed':
-        vehicle.groundspeed = c['speed']
-        print(f"Vehicle speed set to {c['speed']} m/s.")
-
-    elif c['cmd'] == 'set_altitude':
-        print("PLACEHOLDER: set_altitude not implemented yet.")
-        print(f"Vehicle altitude set to {c['altitude']} m.")
+def arm_disarm(vehicle, c: dict) -> None:
+    vehicle.armed = c['arm']
+    print(f"Vehicle {'armed' if c['arm'] else 'disarmed'}.")
+
+def set_mode(vehicle, c: dict) -> None:
+    vehicle.mode = VehicleMode(c['mode'])
+    print(f"Vehicle mode set to {c['mode']}.")
+
+def set_speed(vehicle, c: dict) -> None:
+    vehicle.groundspeed = c['speed']
+    print(f"Vehicle speed set to {c['speed']} m/s.")
+
+def set_altitude(vehicle, c: dict) -> None:
+    print("PLACEHOLDER: set_altitude not implemented yet.")
+    print(f"Vehicle altitude set to {c['altitude']} m.")
+
+def adjust_orbit(vehicle, c: dict) -> None:
+    print("PLACEHOLDER: adjust_orbit not implemented yet.")
+    print(f"Vehicle orbit adjusted to radius {c['radius']} m, direction {c['direction']}.")
+
+def go_to_location(vehicle, c: dict) -> None:
+    vehicle.simple_goto(
+        LocationGlobalRelative(c['ddlat'], c['ddlon'], 
+                               c.get('alt', vehicle.location.global_relative_frame.alt)))
+    print(f"Vehicle navigating to location: lat={c['ddlat']}, lon={c['ddlon']}, alt={c.get('alt', 'current altitude')} m.")
+
+# Command name -> handler(vehicle, params), add new commands here
+CMD_TABLE = {
+    'arm_disarm': arm_disarm,
+    'set_mode': set_mode,
+    'set_speed': set_speed,
+    'set_altitude': set_altitude,
+    'adjust_orbit': adjust_orbit,
+    'go_to_location': go_to_location,
+}
 
-    elif c['cmd'] == 'adjust_orbit':
-        print("PLACEHOLDER: adjust_orbit not implemented yet.")
-        print(f"Vehicle orbit adjusted to radius {c['radius']} m, direction {c['direction']}.")
+def run_command(command: Command, vehicle) -> None:
+    command_params = dict(zip(command['cmd_keys'], command['cmd_values']))
+    cmd_name = command['cmd']
+    c = {'cmd': cmd_name} | command_params
 
-    elif c['cmd'] == 'go_to_location':
-        vehicle.simple_goto(
-            LocationGlobalRelative(c['ddlat'], c['ddlon'], 
-                                   c.get('alt', vehicle.location.global_relative_frame.alt)))
-        print(f"Vehicle navigating to location: lat={c['ddlat']}, lon={c['ddlon']}, alt={c.get('alt', 'current altitude')} m.")
+    handler = CMD_TABLE.get(cmd_name)
+    if not handler:
+        print(f"Unknown command: {cmd_name}. Cannot execute.")
+        return
 
-    else:
-        print(f"Unknown command: {c['cmd']}. Cannot execute.")
+    try:
+        handler(vehicle, c)
+    except Exception as e:
+        print(f"Command {cmd_name} failed: {e!r}")
 
-def eval_conditional_commands(cmds: List[Command],
-                              messages: List[dict],
-                              context: str,
-                              vehicle_state: dict) -> ConditionalEvalOutput:
-    """
-    Evaluates conditional commands based on the current vehicle state and context.
-    """
-    prompt_template = """
+CONDITIONAL_EVAL_INSTRUCTIONS = """
     Evaluate conditional commands based on the current vehicle state.
     For each command, determine if it is "ready" to be executed, "deferred" for later evaluation,
     "not_ready" if conditions are not met, or "removed" if the command is no longer relevant or valid.
     Provide a brief reason for each evaluation.
     Return the results in a list of EvaluatedCommand objects.
+    """
 
+CONDITIONAL_EVAL_TEMPLATE = string.Template("""
     Commands to evaluate:
-    {commands}
+    $commands
 
     Situational context:
-    {context}
+    $context
 
     Current vehicle state:
-    {vehicle_state}
+    $vehicle_state
 
+    """)
+
+def conditional_eval_input(cmds: List[Command],
+                           messages: List[dict],
+                           context: str,
+                           vehicle_state: dict) -> List[dict]:
+    """
+    Input messages to evaluate conditional commands based on the current vehicle state and context.
     """
-    commands = [json.dumps(cmd) for cmd in cmds]
+    input_content = CONDITIONAL_EVAL_TEMPLATE.substitute(
+        commands="\n".join(json.dumps(cmd) for cmd in cmds),
+        context=context,
+        vehicle_state=repr_vehicle_state(vehicle_state)
+    )
 
-    input_messages = [messages[0]]  # Developer message
+    # Static instructions go in a system message ahead of the changing commands and state, for prompt caching
+    input_messages = [
+        messages[0],  # Developer message
+        {"role": "system", "content": CONDITIONAL_EVAL_INSTRUCTIONS},
+        {"role": "user", "content": input_content}
+    ]
 
-    input_content = prompt_template.format(commands="\n".join(commands),
-                                          context=context,
-                                          vehicle_state=json.dumps(vehicle_state, indent=2))
-    
-    input_messages.append({"role": "user", "content": input_content})
+    return input_messages
 
-    result = client.responses.parse(
+async def eval_conditional_commands(cmds: List[Command],
+                                    messages: List[dict],
+                                    context: str,
+                                    vehicle_state: dict) -> ConditionalEvalOutput:
+    """
+    Evaluates conditional commands based on the current vehicle state and context.
+    """
+    input_messages = conditional_eval_input(cmds, messages, context, vehicle_state)
+
+    result = await rate_limited_client.parse(
+        num_tokens_from_messages(input_messages),
         model="gpt-4.1-nano",
         input=input_messages,
         temperature=0.0,
@@ -438,10 +811,12 @@ def eval_conditional_commands(cmds: List[Command],
 
 
 # Summarizer Components
+RESPONSE_TIMESTAMP = re.compile(r"^\d+ \| ")  # Leading "<unix time> | " of a response header
+
 class Summarizer:     
     """
     Summarizer class to maintain an evolving summary of the conversation.
-    The delay is used to control how often the summarizer checks for new events.
+    The background task waits on the queue, put None on it to stop.
 
     use example:
 
@@ -451,10 +826,11 @@ class Summarizer:
         ...in the main loop or script, after an LLM or system step...
 
             summarizer_package = messages[-n:]  # Get the last n (2) messages for summarization 
-            summarizer.queue.put(summarizer_package)  # Add new events to the queue for processing
+            summarizer.queue.put_nowait(summarizer_package)  # Add new events to the queue for processing
 
-    The Summarizer will run in a separate thread and process the queue
-        to update the evolving summary with new events.
+    The Summarizer will run as an asyncio task and process the queue
+        to update the evolving summary with new events, while the main loop awaits other steps.
+    Create it from inside the running event loop.
     """
 
     developer_message = (
@@ -467,68 +843,89 @@ class Summarizer:
         "You should focus on key points, actions taken, and any important updates."
     )
 
-    def __init__(self, delay=2, model="gpt-4.1-nano"):
-        self.delay = delay  # Delay in seconds
+    def __init__(self, model="gpt-4.1-nano", cache_size: int = 128):
         self.model = model
-        self.queue = queue.Queue()
+        self.queue = asyncio.Queue()
         self.overall_summary = None  # A longer summary of the entire session
         self.evolving_summary = None  # A summary that evolves with each new input
         self.usage = {
             "count": 0, "total": 0, "average": 0,"last": 0,
         }
         self.current_status = None  # Current status of the vehicle or operation, in a few words
-        self.thread = threading.Thread(target=self.run, daemon=True)
-        self.thread.start()
+        # Hashes of events already in the summary, so duplicates (retries, repeated script events) skip the LLM
+        self.seen_events: OrderedDict[str, None] = OrderedDict()
+        self.cache_size = cache_size
+        self.task = asyncio.create_task(self.run())
 
-    def run(self):
+    @staticmethod
+    def events_key(events: List[dict]) -> str:
+        """
+        Hash of the events' roles and contents, without the leading timestamp of a response header,
+        so the same input and decision give the same key whenever they arrive.
+        """
+        parts = (f"{event['role']}: {RESPONSE_TIMESTAMP.sub('', event['content'])}" for event in events)
+        return hashlib.sha256("\x00".join(parts).encode()).hexdigest()
+
+    def seen(self, key: str) -> bool:
+        """ Whether the events were summarized already, recording them if not. """
+        if key in self.seen_events:
+            self.seen_events.move_to_end(key)
+            return True
+        self.seen_events[key] = None
+        if len(self.seen_events) > self.cache_size:
+            self.seen_events.popitem(last=False)
+        return False
+
+    async def run(self):
         while True:
-            if not self.queue.empty():
-                new_events = self.queue.get()
-                if new_events:
-                    
-                    update_prompt = (
-                        "This is a summary of the recent events in the flight operations system:\n\n"
-                        f"{self.evolving_summary}\n\n"
-                        f"Here are new events that occurred:\n\n{json.dumps(new_events)}\n\n"
-                        "If these events are important, update the summary to include them, but,"
-                        " this summary must be five or less sentences long. Therefore, the summary"
-                        " shoudl evolve with each new input, but not grow indefinitely, as older events"
-                        " may become less relevant over time and newer events are more important to provide"
-                        " context for the human operator and the AI assistant."
-                    )
-
-                    summary_input = [
-                        {"role": "system", "content": Summarizer.developer_message},
-                        {"role": "user", "content": update_prompt}
-                    ]
-
-                    result = client.responses.parse(
-                        model=self.model,
-                        input=summary_input,
-                        temperature=0.0,
-                        top_p=0.1,
-                        text_format=MessagesSummarizer,
-                    )
-
-                    self.evolving_summary = result.output_parsed.summary.strip()
-                    self.current_status = result.output_parsed.status.strip() if result.output_parsed.status else None
-
-                    self.usage["last"] = result.usage.total_tokens
-                    self.usage["total"] += result.usage.total_tokens
-                    self.usage["count"] += 1
-                    self.usage["average"] = self.usage["total"] / self.usage["count"]
-
-
-                    print(f"\nUpdated Evolving Summary:\n{self.evolving_summary}\n")
-
-            time.sleep(2)
-
-    def summarize_messages(self, messages: List[dict]) -> str:
+            new_events = await self.queue.get()  # Wait for events, no polling
+            if new_events is None:  # Sentinel to stop
+                break
+
+            if not new_events or self.seen(self.events_key(new_events)):
+                continue  # Already in the summary
+
+            update_prompt = (
+                "This is a summary of the recent events in the flight operations system:\n\n"
+                f"{self.evolving_summary}\n\n"
+                f"Here are new events that occurred:\n\n{json.dumps(new_events)}\n\n"
+                "If these events are important, update the summary to include them, but,"
+                " this summary must be five or less sentences long. Therefore, the summary"
+                " shoudl evolve with each new input, but not grow indefinitely, as older events"
+                " may become less relevant over time and newer events are more important to provide"
+                " context for the human operator and the AI assistant."
+            )
+
+            summary_input = [
+                {"role": "system", "content": Summarizer.developer_message},
+                {"role": "user", "content": update_prompt}
+            ]
+
+            result = await rate_limited_client.parse(
+                num_tokens_from_messages(summary_input),
+                model=self.model,
+                input=summary_input,
+                temperature=0.0,
+                top_p=0.1,
+                text_format=MessagesSummarizer,
+            )
+
+            self.evolving_summary = result.output_parsed.summary.strip()
+            self.current_status = result.output_parsed.status.strip() if result.output_parsed.status else None
+
+            self.usage["last"] = result.usage.total_tokens
+            self.usage["total"] += result.usage.total_tokens
+            self.usage["count"] += 1
+            self.usage["average"] = self.usage["total"] / self.usage["count"]
+
+            print(f"\nUpdated Evolving Summary:\n{self.evolving_summary}\n")
+
+    async def summarize_messages(self, messages: List[dict]) -> str:
         """
         Summarize the messages in the conversation.
 
         This function processes the messages and generates a concise summary of the conversation history.
-        This function doesn't run in a separate thread is called on demand
+        This function doesn't run in the background task, it is awaited on demand.
 
         Args:
             messages (List[dict]): The list of messages to summarize.
@@ -536,9 +933,10 @@ class Summarizer:
         Returns:
             str: A concise summary of the conversation history.
         """
-        input_content = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
+        input_content = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
 
-        result = client.responses.parse(
+        result = await rate_limited_client.parse(
+            len(ENCODING.encode(input_content, disallowed_special=())),
             model=self.model,
             input=input_content,
             temperature=0.0,
@@ -574,23 +972,33 @@ class MessagesSummarizer(BaseModel):
 
 
 # Dronekit Components
+RAD_TO_DEG = 180 / math.pi
+
+def round_or_none(value: Optional[float], ndigits: Optional[int] = None, scale: float = 1.0) -> Optional[float]:
+    """ Round a telemetry value, which dronekit leaves as None until its first message arrives. """
+    return None if value is None else round(value * scale, ndigits)
+
 def get_vehicle_state(vehicle, status_text: str = None) -> dict:
     """
     Get the current state of the vehicle.
     This function simulates getting the vehicle state, replace with actual vehicle state retrieval logic.
+    Attitude and location are read once each, rather than once per field.
     """
+    attitude = vehicle.attitude
+    location = vehicle.location.global_relative_frame
+
     return {
         "current_time": round(time.time()),
-        "speed": vehicle.groundspeed,
+        "speed": round_or_none(vehicle.groundspeed, 1),
         "mode": vehicle.mode.name,
-        "heading": round(vehicle.heading),
-        "roll": round(math.degrees(vehicle.attitude.roll)),
-        "pitch": round(math.degrees(vehicle.attitude.pitch)),
-        "yaw": round(math.degrees(vehicle.attitude.yaw)),
+        "heading": round_or_none(vehicle.heading),
+        "roll": round_or_none(attitude.roll, scale=RAD_TO_DEG),
+        "pitch": round_or_none(attitude.pitch, scale=RAD_TO_DEG),
+        "yaw": round_or_none(attitude.yaw, scale=RAD_TO_DEG),
         "location": {
-            "lat": vehicle.location.global_relative_frame.lat,
-            "lon": vehicle.location.global_relative_frame.lon,
-            "alt": vehicle.location.global_relative_frame.alt   
+            "lat": round_or_none(location.lat, 6),
+            "lon": round_or_none(location.lon, 6),
+            "alt": round_or_none(location.alt, 1)
         },
         "armed": vehicle.armed,
         "status": status_text or "N/A",
@@ -598,18 +1006,134 @@ def get_vehicle_state(vehicle, status_text: str = None) -> dict:
         "eta": None
     }
 
+# Field order for repr_vehicle_state, any other keys follow sorted
+VEHICLE_STATE_FIELDS = [
+    "current_time", "mode", "armed", "speed", "heading", "roll", "pitch", "yaw",
+    "location", "status", "destination", "eta"
+]
 
-if __name__ == "__main__":
+def repr_vehicle_state(vehicle_state: dict) -> str:
+    """
+    Represent the vehicle state as one compact line of key=value pairs in a fixed order,
+    e.g. "current_time=1755880000 mode=GUIDED armed=True ... location=(lat=-35.363262 lon=149.165237 alt=10.0)".
+    Fewer tokens than indented JSON, and the same state always renders byte-identical.
+    """
+    def repr_value(value):
+        if isinstance(value, dict):
+            return "(" + " ".join(f"{k}={repr_value(v)}" for k, v in value.items()) + ")"
+        return str(value)
 
-    # Create vehicle by connecting to the Mission Planner SITL instance
-    vehicle = connect('tcp:127.0.0.1:5763', wait_ready=True)
-    print("Connected to vehicle")
-    time.sleep(0.5)
-    
-    
-    os.environ["OPENAI_API_KEY"] = input("Enter your OpenAI API key: ").strip()
+    keys = [k for k in VEHICLE_STATE_FIELDS if k in vehicle_state]
+    keys += sorted(k for k in vehicle_state if k not in VEHICLE_STATE_FIELDS)
+    return " ".join(f"{k}={repr_value(vehicle_state[k])}" for k in keys)
+
+
+async def read_inputs(input_queue: asyncio.Queue):
+    """
+    Feed input lines into the queue as they are entered, ending with None on 'exit'.
+    Scripts can put their 'system:' inputs on the same queue.
+    """
+    while True:
+        new_input = (await asyncio.to_thread(input, "Enter new input (or 'exit' to quit): ")).strip()
+
+        if new_input.lower() == 'exit':
+            await input_queue.put(None)
+            return
+
+        await input_queue.put(new_input)
+
+async def drain_inputs(input_queue: asyncio.Queue, batch_size: int = 8, timeout: float = 0.1) -> List[Optional[str]]:
+    """
+    Wait for the next input, then collect any others that arrive within timeout, up to batch_size.
+    """
+    batch = [await input_queue.get()]
 
-    client = openai.Client()
+    while len(batch) < batch_size and batch[-1] is not None:
+        try:
+            batch.append(await asyncio.wait_for(input_queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+
+    return batch
+
+def is_runnable(command: Command) -> bool:
+    return command['cmd_type'] == 'immediate' and command['cmd'] != 'rejected'
+
+# Commands that change what the others mean, always run on their own
+MODE_CMDS = {"set_mode", "arm_disarm"}
+# Commands that set where the vehicle goes, at most one per parallel run
+MOVEMENT_CMDS = {"go_to_location", "adjust_orbit", "set_altitude"}
+
+def parallel_runs(cmds: List[Command]) -> List[List[Command]]:
+    """
+    Split one decision's commands, in order, into consecutive runs that are safe to run together:
+    commands of different types, with no mode change and at most one movement command.
+    Anything that conflicts starts a new run, so conflicting commands keep the decision's order.
+    """
+    runs = []
+    for c in cmds:
+        run = runs[-1] if runs else None
+        if (run is None
+                or c['cmd'] in MODE_CMDS
+                or run[0]['cmd'] in MODE_CMDS
+                or any(r['cmd'] == c['cmd'] for r in run)
+                or (c['cmd'] in MOVEMENT_CMDS and any(r['cmd'] in MOVEMENT_CMDS for r in run))):
+            runs.append([c])
+        else:
+            run.append(c)
+    return runs
+
+async def run_commands(command_queue: asyncio.Queue, vehicle, max_workers: int = 4) -> None:
+    """
+    Run queued commands, ending on None.
+    Each queue item is the list of commands from one decision, run in the order given.
+    Only non-conflicting neighbours (see parallel_runs) run together on the thread pool.
+    Dronekit calls are blocking, so all of them run in worker threads.
+    """
+    loop = asyncio.get_running_loop()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            cmds = await command_queue.get()
+            if cmds is None:
+                return
+
+            for run in parallel_runs(cmds):
+                results = await asyncio.gather(*(
+                    loop.run_in_executor(executor, run_command, c, vehicle) for c in run
+                ), return_exceptions=True)
+
+                # Log and carry on, so one bad command doesn't stop the ones queued after it
+                for c, result in zip(run, results):
+                    if isinstance(result, Exception):
+                        print(f"Command {c.get('cmd')} failed: {result!r}")
+
+async def handle_decision(decision: CombinedDecision, command_queue: asyncio.Queue, queue_commands: bool = True) -> None:
+    """
+    Report a decision and queue its immediate commands to run.
+    queue_commands is False when they were already queued as the response streamed in.
+    """
+    print(f"\nNew Input Step Output:\n{DECISION_ADAPTER.dump_json(decision).decode()}\n")
+
+    if decision.decision == "operational_response":
+        tasks = decision.tasks
+
+        if tasks:
+            print(f"\nTasks to handle: {tasks}\n")
+
+            if decision.response_content:
+                print("\nResponse:\n", decision.response_content)
+
+            if decision.cmds:
+                
+                for c in decision.cmds:
+                    
+                    print(f"\n{repr_command(c)}\n")
+
+                if queue_commands:
+                    command_queue.put_nowait([c for c in decision.cmds if is_runnable(c)])
+
+async def main(vehicle):
 
     flight_developer_message = (
         "You are a flight operations assistant for an ArduPilot drone. "
@@ -623,92 +1147,118 @@ if __name__ == "__main__":
     messages = [
         {"role": "developer", "content": flight_developer_message},
     ]
+    # History kept after the developer message, the evolving summary carries older context
+    max_history = 50
 
     inputs = 0
 
-    summarizer = Summarizer()  # Run the summarizer in a separate thread, via queue
+    summarizer = Summarizer()  # Run the summarizer as a background asyncio task, via queue
     summarizer.evolving_summary = "No events to summarize yet."
     
 
-    vehicle_state = get_vehicle_state(vehicle, summarizer.current_status)
+    # Dronekit calls are blocking, so they run in a worker thread to keep the event loop free
+    vehicle_state = await asyncio.to_thread(get_vehicle_state, vehicle, summarizer.current_status)
 
-    while True:
+    # Inputs arriving together are sent in one LLM call
+    input_queue = asyncio.Queue()
+    reader_task = asyncio.create_task(read_inputs(input_queue))
 
-        new_input = input("Enter new input (or 'exit' to quit): ").strip()
+    # Immediate commands run in the background, starting as soon as each streams in
+    command_queue = asyncio.Queue()
+    command_task = asyncio.create_task(run_commands(command_queue, vehicle))
 
-        if not new_input:
-            print("Empty input, please try again.")
-            continue
+    def queue_streamed_command(c: Command):
+        if is_runnable(c):
+            print(f"    --> Immediate command received: {c['cmd']}")
+            command_queue.put_nowait([c])  # Streamed commands run one at a time, in arrival order
 
-        elif new_input.lower() == 'exit':
-            print("Exiting...")
-            break
-        
-        # Simulate system messages with 'system:' prefix to input
-        elif new_input.lower().startswith("system:"):
-            new_input = new_input[7:].strip()
-            input_source = "script"
+    while True:
 
-        else:
-            input_source = "user"
+        batch = await drain_inputs(input_queue)
+        exiting = batch[-1] is None
 
-        
-        vehicle_state = get_vehicle_state(vehicle, summarizer.current_status)
-
-        inputs += 1
-
-        classifier_output = new_input_step(
-            input_content=new_input,
-            messages=messages,
-            input_timestamp=time.time(),
-            input_source=input_source,
-            model="gpt-4.1-mini",
-            messages_limit=5,
-            context=summarizer.evolving_summary,
-            vehicle_state=vehicle_state
-        )
+        new_inputs = []
+        for new_input in batch:
 
-        parsed_classifier_output, messages, elapsed, token_count = classifier_output
+            if new_input is None:
+                break
 
-        print(f"\nNew Input Step Output:\n{parsed_classifier_output.model_dump_json(indent=2)}\n")
+            elif not new_input:
+                print("Empty input, please try again.")
+                continue
 
-    
-        summarizer_package = messages[-2:]  # Get the last two messages for summarization
-        summarizer.queue.put(summarizer_package)
+            # Simulate system messages with 'system:' prefix to input
+            elif new_input.lower().startswith("system:"):
+                new_inputs.append((new_input[7:].strip(), "script"))
 
+            else:
+                new_inputs.append((new_input, "user"))
 
-        if parsed_classifier_output.decision == "operational_response":
-            tasks = parsed_classifier_output.tasks
+        if new_inputs:
 
-            if tasks:
-                print(f"\nTasks to handle: {tasks}\n")
+            vehicle_state = await asyncio.to_thread(get_vehicle_state, vehicle, summarizer.current_status)
 
-                handle_tasks_output = handle_tasks_step(
-                    tasks=tasks,
-                    model="gpt-4.1-mini",
-                    context=summarizer.evolving_summary,
-                    vehicle_state=vehicle_state
+            inputs += len(new_inputs)
+
+            input_step_args = dict(
+                messages=messages,
+                input_timestamp=time.time(),
+                model="gpt-4.1-nano",
+                messages_limit=5,
+                context=summarizer.evolving_summary,
+                vehicle_state=vehicle_state
+            )
+
+            if len(new_inputs) == 1:
+                input_content, input_source = new_inputs[0]
+                parsed_output, messages, elapsed, token_count = await new_input_step(
+                    input_content=input_content, input_source=input_source,
+                    on_command=queue_streamed_command, **input_step_args
                 )
+                decisions = [parsed_output]
+                commands_queued = True
+            else:
+                parsed_output, messages, elapsed, token_count = await new_batch_input_step(
+                    new_inputs, **input_step_args
+                )
+                decisions = parsed_output.items
+                commands_queued = False
+
+        
+            # The summary update runs in the summarizer task, overlapping the commands run below.
+            # 'no response' inputs stay in messages but don't update the summary
+            if any(decision.decision != "no response" for decision in decisions):
+                summarizer_package = messages[-2:]  # Get the last two messages for summarization
+                summarizer.queue.put_nowait(summarizer_package)
 
-                print("\nHandle Tasks Step\n", handle_tasks_output.model_dump_json(indent=2))
+            for decision in decisions:
+                await handle_decision(decision, command_queue, queue_commands=not commands_queued)
 
-                messages.append({"role": "assistant", "content": handle_tasks_output.response})
+            del messages[1:-max_history]  # Drop the oldest history, keeping the developer message
 
+        if exiting:
+            print("Exiting...")
+            await summarizer.summarize_messages(messages)
+            print(f"\nSession Summary:\n{summarizer.overall_summary}\n")
+            break
 
-                if handle_tasks_output.response:
-                    print("\nResponse:\n", handle_tasks_output.response)
+    reader_task.cancel()
+    command_queue.put_nowait(None)
+    await command_task  # Let queued commands finish
+    summarizer.queue.put_nowait(None)
 
-                if handle_tasks_output.cmds:
-                    
-                    for c in handle_tasks_output.cmds:
-                        
-                        print(f"\n{repr_command(c)}\n")
-                        
-                        if c['cmd_type'] == 'immediate' and c['cmd'] != 'rejected':
-                            run_command(c, vehicle)
 
-        summarizer.summarize_messages(messages)
-        print(f"\nEvolving Summary:\n{summarizer.evolving_summary}\n")
+if __name__ == "__main__":
 
+    # Create vehicle by connecting to the Mission Planner SITL instance
+    vehicle = connect('tcp:127.0.0.1:5763', wait_ready=True)
+    print("Connected to vehicle")
+    time.sleep(0.5)
+    
+    
+    os.environ["OPENAI_API_KEY"] = input("Enter your OpenAI API key: ").strip()
 
+    client = openai.AsyncOpenAI()
+    rate_limited_client = RateLimitedClient(client)
 
+    asyncio.run(main(vehicle))